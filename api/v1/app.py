@@ -4,7 +4,7 @@
 '''
 
 
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from models import storage
 from api.v1.views import app_views
@@ -16,6 +16,22 @@ CORS(app, resources={r"/*": {"origins": "0.0.0.0"}})
 app.register_blueprint(app_views, url_prefix='/api/v1')
 
 
+# endpoints only reading from storage despite their method
+read_only_endpoints = {"app_views.places_search"}
+
+
+@app.before_request
+def route_storage():
+    '''Sends the reads of read-only requests to the read replicas of the
+        database, if any, keeping a client on the primary database for a
+        while after it wrote
+    '''
+    if hasattr(storage, "route"):
+        storage.route(request.remote_addr,
+                      request.method not in ("GET", "HEAD", "OPTIONS") and
+                      request.endpoint not in read_only_endpoints)
+
+
 @app.errorhandler(404)
 def not_found(e):
     '''The endpoint handles 404 errors by returning a JSON
@@ -26,9 +42,11 @@ def not_found(e):
 
 @app.teardown_appcontext
 def teardown(self):
-    '''Removes all SQLAlchemy Session after handling each request
+    '''Removes all SQLAlchemy Session after handling each request, or
+        once its streamed response was sent
     '''
-    storage.close()
+    if not g.get("streaming"):
+        storage.close()
 
 
 if __name__ == '__main__':
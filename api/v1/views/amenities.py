@@ -4,6 +4,7 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
 from models import storage
 from models.amenity import Amenity
 
@@ -12,9 +13,7 @@ from models.amenity import Amenity
 def get_all_amenities():
     '''Retrieves the list of all Amenity objects
     '''
-    all_amenities = [amenity.to_dict() for amenity in storage
-                     .all(Amenity).values()]
-    return jsonify(all_amenities)
+    return listing(Amenity, storage.iterate(Amenity))
 
 
 @app_views.route('/amenities/<amenity_id>', methods=['GET'],
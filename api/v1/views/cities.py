@@ -4,6 +4,7 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
 from models import storage
 from models.city import City
 from models.state import State
@@ -17,8 +18,7 @@ def get_all_cities_by_state(state_id):
     state = storage.get(State, state_id)
     if state is None:
         abort(404)
-    all_cities = [city.to_dict() for city in state.cities]
-    return jsonify(all_cities)
+    return listing(City, state.cities, "state_id", state.id)
 
 
 @app_views.route('/cities/<city_id>', methods=['GET'], strict_slashes=False)
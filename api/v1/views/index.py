@@ -3,7 +3,7 @@
 '''
 
 from api.v1.views import app_views
-from flask import jsonify
+from flask import abort, jsonify
 from models import storage
 from models.amenity import Amenity
 from models.city import City
@@ -26,13 +26,24 @@ def status():
 def stats():
     '''The endpoint returns the number of each objects by type
     '''
+    counts = storage.counts([Amenity, City, Place, Review, State, User])
     return jsonify(
             {
-                "amenities": storage.count(Amenity),
-                "cities": storage.count(City),
-                "places": storage.count(Place),
-                "reviews": storage.count(Review),
-                "states": storage.count(State),
-                "users": storage.count(User),
+                "amenities": counts["Amenity"],
+                "cities": counts["City"],
+                "places": counts["Place"],
+                "reviews": counts["Review"],
+                "states": counts["State"],
+                "users": counts["User"],
             }
         )
+
+
+@app_views.route('/stats/pool', methods=['GET'], strict_slashes=False)
+def pool_stats():
+    '''The endpoint returns the statistics of the database connection
+        pool
+    '''
+    if not hasattr(storage, "pool_stats"):
+        abort(404)
+    return jsonify(storage.pool_stats())
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+'''Pages the lists of the API. A list requested with ?limit=N holds at
+    most N objects in the order of their IDs, and its Link header points
+    to the next page through an opaque cursor; ?count=1 adds the number
+    of objects of the whole list in an X-Total-Count header
+'''
+
+import base64
+import binascii
+from api.v1.views.streaming import json_list
+from flask import abort, request
+from models import storage
+from os import getenv
+from urllib.parse import urlencode
+
+max_limit = int(getenv('HBNB_API_MAX_LIMIT', 1000))
+
+
+def encode_cursor(id):
+    '''Returns the cursor of the page starting after the ID id
+    '''
+    return base64.urlsafe_b64encode(id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    '''Returns the ID the page of cursor starts after
+    '''
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4),
+                                altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        abort(400, 'Invalid cursor')
+
+
+def listing(cls, everything, attr=None, value=None):
+    '''Returns the response listing the objects of cls, only the ones
+        whose attr equals value if attr is given: the page asked for if
+        the request has a limit, otherwise the objects of everything
+    '''
+    limit = request.args.get('limit')
+    if limit is None:
+        return json_list(obj.to_dict() for obj in everything)
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400, 'Invalid limit')
+    if not 0 < limit <= max_limit:
+        abort(400, 'Invalid limit')
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'])
+    # one more object tells whether there is a next page
+    objs = storage.page(cls, limit + 1, after, attr, value)
+    headers = {}
+    if len(objs) > limit:
+        objs = objs[:limit]
+        args = request.args.to_dict()
+        args['cursor'] = encode_cursor(objs[-1].id)
+        headers['Link'] = '<{}?{}>; rel="next"'.format(request.base_url,
+                                                       urlencode(args))
+    if request.args.get('count') in ('1', 'true'):
+        headers['X-Total-Count'] = str(storage.count(cls, attr, value))
+    return json_list([obj.to_dict() for obj in objs], headers)
@@ -4,6 +4,8 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
+from api.v1.views.streaming import json_list
 from models import storage
 from models.city import City
 from models.state import State
@@ -21,9 +23,14 @@ def get_all_places_by_city(city_id):
     city = storage.get(City, city_id)
     if city is None:
         abort(404)
-    all_places = [place.to_dict() for place in storage.all(Place).values()
-                  if place.city_id == city_id]
-    return jsonify(all_places)
+    return listing(Place, city.places, "city_id", city.id)
+
+
+def str_ids(ids):
+    '''Returns the ids of the list ids that are strings, the only ones
+        an object can have
+    '''
+    return [id for id in ids if isinstance(id, str)]
 
 
 @app_views.route('/places_search', methods=['POST'], strict_slashes=False)
@@ -41,64 +48,63 @@ def places_search():
         p_cities = payload.get("cities", None)
         p_amenities = payload.get("amenities", None)
 
+    # the relationships walked below are loaded with the objects, so the
+    # search takes the same number of queries for any number of states,
+    # cities and places
+    places_load = []
+    if payload and payload.get('amenities'):
+        places_load = ['amenities']
+
     all_places = []
     if not payload or not len(payload) or (
         not p_states and
         not p_cities
     ):
-        all_places = [place for place in storage.all(Place).values()]
+        all_places = [place for place in
+                      storage.all(Place, load=places_load).values()]
     else:
-        all_cities_ids = []
+        city_ids = []
 
-        # get all city ids for all specifies states
+        # get all cities for all specifies states; in DB mode, the states
+        # and their cities are kept in memory
         if 'states' in payload and len(payload.get('states')) > 0:
-            for state_id in payload.get('states'):
-                state = storage.get(State, state_id)
-                if not state:
-                    continue
-                all_cities_ids.extend([city.id for city in state.cities])
+            states = storage.get_many(State, str_ids(payload.get('states')),
+                                      load=['cities'])
+            for state in states:
+                city_ids.extend(city.id for city in state.cities)
 
-        # add all city ids not already in the list of city ids
+        # add all cities not already in the list of cities
         # for all specified cities
         if 'cities' in payload and len(payload.get('cities')) > 0:
-            for city_id in payload.get('cities'):
-                city = storage.get(City, city_id)
-                if city is None:
-                    continue
-                if city_id not in all_cities_ids:
-                    all_cities_ids.append(city_id)
-
-        # get all places for all city ids
-        for city_id in all_cities_ids:
-            city = storage.get(City, city_id)
-            if not city:
-                continue
+            city_ids.extend(str_ids(payload.get('cities')))
+
+        all_cities = storage.get_many(
+            City, list(dict.fromkeys(city_ids)),
+            load=['places'] + ['places.' + path for path in places_load])
+
+        # get all places for all cities
+        for city in all_cities:
             places_by_city = [place for place in city.places]
             all_places.extend(places_by_city)
 
     if 'amenities' in payload and len(payload.get('amenities')) > 0:
         amenity_ids = payload.get('amenities', None)
-        amenities = []
-
-        for amenity_id in amenity_ids:
-            amenity = storage.get(Amenity, amenity_id)
-            # if not amenity:
-            #    continue
-            amenities.append(amenity)
-        filtered_places = [place for place in all_places
-                           if all([am in place.amenities for am in amenities])]
-
-        place_list = []
-        for place in filtered_places:
-            dic = place.to_dict()
-            dic.pop('amenities', None)
-            place_list.append(dic)
-        print(len(place_list))
-        return jsonify(place_list)
+        ids = str_ids(amenity_ids)
+        amenities = storage.get_many(Amenity, ids)
+        if len(ids) < len(amenity_ids) or len(set(amenities)) < len(set(ids)):
+            # an unknown amenity, which no place has
+            amenities.append(None)
+        filtered_places = (place for place in all_places
+                           if all([am in place.amenities for am in amenities]))
+
+        def place_dicts():
+            for place in filtered_places:
+                dic = place.to_dict()
+                dic.pop('amenities', None)
+                yield dic
+        return json_list(place_dicts())
     else:
-        filtered_places = [place.to_dict() for place in set(all_places)]
-        print(len(filtered_places))
-        return jsonify(filtered_places)
+        return json_list(place.to_dict() for place in set(all_places))
 
 
 @app_views.route('/places/<place_id>', methods=['GET'], strict_slashes=False)
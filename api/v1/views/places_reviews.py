@@ -4,6 +4,7 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
 from models import storage
 from models.place import Place
 from models.user import User
@@ -19,9 +20,7 @@ def get_all_reviews_by_place(place_id):
     place = storage.get(Place, place_id)
     if place is None:
         abort(404)
-    all_reviews = [review.to_dict() for review in storage.all(Review).values()
-                   if review.place_id == place_id]
-    return jsonify(all_reviews)
+    return listing(Review, place.reviews, "place_id", place.id)
 
 
 @app_views.route('/reviews/<review_id>', methods=['GET'], strict_slashes=False)
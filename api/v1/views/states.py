@@ -4,6 +4,7 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
 from models import storage
 from models.state import State
 
@@ -12,8 +13,7 @@ from models.state import State
 def get_all_states():
     '''Retrieves the list of all State objects
     '''
-    all_states = [state.to_dict() for state in storage.all(State).values()]
-    return jsonify(all_states)
+    return listing(State, storage.iterate(State))
 
 
 @app_views.route('/states/<state_id>', methods=['GET'], strict_slashes=False)
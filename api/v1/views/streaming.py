@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+'''Streams the JSON arrays of the API. A list of at most
+    HBNB_API_STREAM_THRESHOLD objects is sent like jsonify sends it; a
+    longer one is sent in chunks as its objects are serialized, holding
+    the same bytes
+'''
+
+from flask import current_app, g, jsonify, stream_with_context
+import itertools
+from os import getenv
+
+stream_threshold = int(getenv('HBNB_API_STREAM_THRESHOLD', 100))
+# the size of the chunks sent, in characters
+chunk_size = 64 * 1024
+
+
+def json_list(items, headers=None):
+    '''Returns the response holding the JSON array of the dictionaries
+        items, which may be produced one at a time by a generator
+    '''
+    items = iter(items)
+    first = list(itertools.islice(items, stream_threshold + 1))
+    provider = current_app.json
+    compact = getattr(provider, "compact", None)
+    if len(first) <= stream_threshold or compact is False or (
+            compact is None and current_app.debug):
+        # the objects are sent at once, also when jsonify indents them
+        response = jsonify(first + list(items))
+    else:
+        # the storage stays open until the response is sent
+        g.streaming = True
+        response = current_app.response_class(
+            stream_with_context(chunks(itertools.chain(first, items),
+                                       provider.dumps)),
+            mimetype=provider.mimetype)
+    response.headers.update(headers or {})
+    return response
+
+
+def chunks(items, dumps):
+    '''Yields the compact JSON array of items, serialized by dumps, in
+        chunks of about chunk_size characters
+    '''
+    buffer = ["["]
+    size = 1
+    separator = ""
+    try:
+        for item in items:
+            data = separator + dumps(item, separators=(",", ":"))
+            separator = ","
+            buffer.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        buffer.append("]\n")
+        yield "".join(buffer)
+    finally:
+        g.pop("streaming", None)
@@ -4,6 +4,7 @@
 
 from flask import jsonify, abort, request
 from api.v1.views import app_views
+from api.v1.views.pagination import listing
 from models import storage
 from models.user import User
 
@@ -12,8 +13,7 @@ from models.user import User
 def get_all_users():
     '''Retrieves the JSON list of all User instances
     '''
-    all_users = [user.to_dict() for user in storage.all(User).values()]
-    return jsonify(all_users)
+    return listing(User, storage.iterate(User))
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
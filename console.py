@@ -96,7 +96,7 @@ class HBNBCommand(cmd.Cmd):
             if len(args) > 1:
                 key = args[0] + "." + args[1]
                 if key in models.storage.all():
-                    models.storage.all().pop(key)
+                    models.storage.delete(models.storage.all()[key])
                     models.storage.save()
                 else:
                     print("** no instance found **")
@@ -108,18 +108,18 @@ class HBNBCommand(cmd.Cmd):
     def do_all(self, arg):
         """Prints string representations of instances"""
         args = shlex.split(arg)
-        obj_list = []
         if len(args) == 0:
-            obj_dict = models.storage.all()
+            objs = models.storage.iterate()
         elif args[0] in classes:
-            obj_dict = models.storage.all(classes[args[0]])
+            objs = models.storage.iterate(classes[args[0]])
         else:
             print("** class doesn't exist **")
             return False
-        for key in obj_dict:
-            obj_list.append(str(obj_dict[key]))
         print("[", end="")
-        print(", ".join(obj_list), end="")
+        separator = ""
+        for obj in objs:
+            print(separator + str(obj), end="")
+            separator = ", "
         print("]")
 
     def do_update(self, arg):
@@ -160,5 +160,27 @@ class HBNBCommand(cmd.Cmd):
         else:
             print("** class doesn't exist **")
 
+    def do_compact(self, arg):
+        """Compacts the storage journal into a new snapshot"""
+        if not hasattr(models.storage, "compact"):
+            print("** storage can't be compacted **")
+            return False
+        models.storage.compact(wait=True)
+
+    def do_migrate(self, arg):
+        """Adds the missing tables and indexes to the database"""
+        if not hasattr(models.storage, "migrate"):
+            print("** storage can't be migrated **")
+            return False
+        for name in models.storage.migrate():
+            print(name)
+
+    def do_shard(self, arg):
+        """Converts the JSON file to one file per class (and bucket)"""
+        if not hasattr(models.storage, "reshard"):
+            print("** storage can't be sharded **")
+            return False
+        models.storage.reshard()
+
 if __name__ == '__main__':
     HBNBCommand().cmdloop()
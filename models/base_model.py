@@ -47,6 +47,15 @@ class BaseModel:
             self.created_at = datetime.utcnow()
             self.updated_at = self.created_at
 
+    if models.storage_t != "db":
+        def __setattr__(self, key, value):
+            """sets an attribute, letting the storage know when its value
+            changed"""
+            old = getattr(self, key, None)
+            super().__setattr__(key, value)
+            if old != value:
+                models.storage.touch(self, key, old)
+
     def __str__(self):
         """String representation of the BaseModel class"""
         return "[{:s}] ({:s}) {}".format(self.__class__.__name__, self.id,
@@ -54,6 +63,8 @@ class BaseModel:
 
     def save(self):
         """updates the attribute 'updated_at' with the current datetime"""
+        if not models.storage.is_dirty(self):
+            return
         self.updated_at = datetime.utcnow()
         models.storage.new(self)
         models.storage.save()
@@ -68,6 +79,11 @@ class BaseModel:
         new_dict["__class__"] = self.__class__.__name__
         if "_sa_instance_state" in new_dict:
             del new_dict["_sa_instance_state"]
+        mapper = getattr(type(self), "__mapper__", None)
+        if mapper is not None:
+            # related objects loaded by the session
+            for key in mapper.relationships.keys():
+                new_dict.pop(key, None)
 
         # remove the password key except when it's used by FileStorage
         # to save data to disk.
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Contains the query-result caches of DBStorage. A backend stores values
+under string keys for ttl seconds, and integer counters that never
+expire; MemoryCache keeps them in the process, DirectoryCache in files
+that the processes of a host share, standing in for a cache server such
+as memcached. QueryCache puts a backend behind a single-flight loader
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import hashlib
+import json
+import os
+import threading
+import time
+
+# returned by the backends for the keys holding no value
+MISSING = object()
+
+
+def encode(value):
+    """returns the JSON of value, which may hold datetimes"""
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {"__datetime__": obj.isoformat()}
+        raise TypeError("cannot cache {!r}".format(obj))
+    return json.dumps(value, default=default)
+
+
+def decode(data):
+    """returns the value of the JSON data made by encode"""
+    def object_hook(obj):
+        if len(obj) == 1 and "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+        return obj
+    return json.loads(data, object_hook=object_hook)
+
+
+class MemoryCache:
+    """in-process cache of at most size values, evicting the least
+    recently used one first"""
+
+    def __init__(self, size=10000, ttl=30.0):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # {key: (expiry, value)}, from the least to the most recently used
+        self.values = OrderedDict()
+        self.counters = {}
+
+    def get(self, key):
+        """returns the value stored under key, or MISSING"""
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self.values[key]
+                return MISSING
+            self.values.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        """stores value under key"""
+        with self.lock:
+            self.values[key] = (time.monotonic() + self.ttl, value)
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def counter(self, key):
+        """returns the counter key, 0 until it is increased"""
+        with self.lock:
+            return self.counters.get(key, 0)
+
+    def incr(self, key):
+        """increases the counter key, returning its new value"""
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+
+class DirectoryCache:
+    """cache shared by the processes of a host through the JSON files of
+    the directory path, holding at most about size values. The values
+    are column values: strings, numbers, datetimes, and the lists and
+    dictionaries of them"""
+
+    def __init__(self, path, size=10000, ttl=30.0):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.sets = 0
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.stat(path)
+        if hasattr(os, "getuid") and (info.st_uid != os.getuid() or
+                                      info.st_mode & 0o022):
+            # the files of another user could hold any value
+            raise PermissionError(
+                "{} is not a private directory".format(path))
+
+    def file(self, key, kind="v"):
+        """returns the path of the file of key"""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path, kind + digest)
+
+    def get(self, key):
+        """returns the value stored under key, or MISSING"""
+        try:
+            with open(self.file(key)) as f:
+                stored, expiry, value = decode(f.read())
+        except (OSError, ValueError, TypeError):
+            return MISSING
+        if stored != key or expiry <= time.time():
+            return MISSING
+        return value
+
+    def set(self, key, value):
+        """stores value under key"""
+        path = self.file(key)
+        tmp = "{}.{:d}.{:d}".format(path, os.getpid(), threading.get_ident())
+        with open(tmp, "w") as f:
+            f.write(encode([key, time.time() + self.ttl, value]))
+        os.replace(tmp, path)
+        self.sets += 1
+        if self.sets % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        """removes the values beyond size, the least recently stored
+        first"""
+        paths = []
+        for name in os.listdir(self.path):
+            if name.startswith("v") and "." not in name:
+                try:
+                    path = os.path.join(self.path, name)
+                    paths.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        paths.sort()
+        for mtime, path in paths[:max(len(paths) - self.size, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def counter(self, key):
+        """returns the counter key, 0 until it is increased"""
+        try:
+            with open(self.file(key, "c"), "rb") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def incr(self, key):
+        """increases the counter key, returning its new value"""
+        fd = os.open(self.file(key, "c"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            value = int(os.pread(fd, 32, 0) or 0) + 1
+            os.pwrite(fd, b"%020d" % value, 0)
+            return value
+        finally:
+            os.close(fd)
+
+
+class QueryCache:
+    """reads values through a backend, loading the missing ones once
+    however many threads miss them at the same time"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        # {key: [done event, value, error]} of the loads in progress
+        self.flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def fetch(self, key, load, keep=None):
+        """returns the value cached under key, or the value returned by
+        load, which is then cached unless keep, if given, returns False
+        for it. The threads missing key while it is loaded wait for that
+        load"""
+        value = self.backend.get(key)
+        with self.lock:
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = [threading.Event(), None, None]
+        if not leader:
+            flight[0].wait()
+            if flight[2] is None:
+                return flight[1]
+            # the load failed: try again
+            return self.fetch(key, load)
+        try:
+            with self.lock:
+                self.loads += 1
+            flight[1] = load()
+            if keep is None or keep(flight[1]):
+                self.backend.set(key, flight[1])
+            return flight[1]
+        except BaseException as error:
+            flight[2] = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight[0].set()
+
+    def stats(self):
+        """returns the hits, misses and loads so far"""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "loads": self.loads}
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""
+Contains the JSON helpers of FileStorage: a faster codec when orjson is
+installed, and a streaming reader and writer for the JSON file
+"""
+
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+decoder = json.JSONDecoder()
+whitespace = " \t\n\r"
+
+
+def loads(data):
+    """deserializes a JSON document from a str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """serializes obj to a JSON str"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def dump_records(records, f):
+    """writes a {key: record} dictionary to the text file f as a JSON
+    object holding one member per line, so that iter_records can read it
+    back line by line. The records may be any mapping"""
+    f.write("{")
+    separator = "\n"
+    for key, record in records.items():
+        if record is not None and type(record) is not dict:
+            record = dict(record)
+        f.write(separator + dumps(key) + ": " + dumps(record))
+        separator = ",\n"
+    f.write("\n}\n")
+
+
+def iter_records(f, chunk_size=1 << 16):
+    """yields the (key, record) members of the JSON object stored in the
+    text file f one at a time, without reading the whole file"""
+    # at most chunk_size characters tell the layouts apart: the first
+    # line of a file written by json.dump may hold the whole file
+    first = f.readline(chunk_size)
+    if first.endswith("\n") and first.strip() == "{":
+        yield from iter_lines(f)
+    else:
+        yield from iter_chunks(f, first, chunk_size)
+
+
+def iter_lines(f):
+    """yields the members of a JSON object written with one member per
+    line, after its opening brace was read. Members spanning several
+    lines are read until they are complete"""
+    member = ""
+    for line in f:
+        member += line
+        text = member.strip()
+        if text == "}":
+            return
+        if not text:
+            continue
+        if text.endswith(","):
+            text = text[:-1]
+        try:
+            records = loads("{" + text + "}")
+        except ValueError:
+            if not text.endswith("}"):
+                continue
+            try:
+                # the last member, followed by the closing brace
+                records = loads("{" + text)
+            except ValueError:
+                continue
+            yield from records.items()
+            return
+        yield from records.items()
+        member = ""
+    raise ValueError("unterminated JSON object")
+
+
+def iter_chunks(f, buffer, chunk_size):
+    """yields the members of a JSON object read chunk_size characters at
+    a time, buffer holding the characters already read"""
+    pos = 0
+    eof = False
+    expected = "{"
+    while True:
+        while pos < len(buffer) and buffer[pos] in whitespace:
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("unterminated JSON object")
+            buffer, pos = f.read(chunk_size), 0
+            eof = not buffer
+            continue
+        char = buffer[pos]
+        if char in expected and char != '"':
+            pos += 1
+            if char == "}":
+                return
+            expected = '"}' if char == "{" else '"'
+            continue
+        if char != '"' or '"' not in expected:
+            raise ValueError("unexpected {!r} in JSON object".format(char))
+        try:
+            key, end = decoder.raw_decode(buffer, pos)
+            while buffer[end] in whitespace:
+                end += 1
+            if buffer[end] != ":":
+                raise ValueError("expected ':' in JSON object")
+            end += 1
+            while buffer[end] in whitespace:
+                end += 1
+            record, end = decoder.raw_decode(buffer, end)
+            # a member ending the buffer may be a truncated number
+            if end == len(buffer) and not eof:
+                raise IndexError
+        except (IndexError, json.JSONDecodeError):
+            if eof:
+                raise ValueError("unterminated JSON object")
+            more = f.read(max(chunk_size, len(buffer) - pos))
+            buffer, pos = buffer[pos:] + more, 0
+            eof = not more
+            continue
+        yield key, record
+        pos = end
+        expected = ",}"
@@ -5,6 +5,7 @@ Contains the class DBStorage
 
 import models
 from models.amenity import Amenity
+from models.engine import cache
 from models.base_model import BaseModel, Base
 from models.city import City
 from models.place import Place
@@ -12,12 +13,127 @@ from models.review import Review
 from models.state import State
 from models.user import User
 from os import getenv
+import contextlib
+import getpass
+import itertools
+import os
 import sqlalchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, event, func, select, Select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, selectinload, sessionmaker
+from sqlalchemy.orm import make_transient_to_detached, Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import QueuePool, StaticPool
+import tempfile
+import threading
+import time
 
 classes = {"Amenity": Amenity, "City": City,
            "Place": Place, "Review": Review, "State": State, "User": User}
+# the database URLs whose schema this process created
+schemas = set()
+# the small, rarely changed classes kept in memory, and the relationships
+# between them loaded with them
+reference = {"Amenity": {}, "City": {"state": "State"},
+             "State": {"cities": "City"}}
+
+
+def sqlite_connect(dbapi_connection, connection_record):
+    """tunes a new SQLite connection: write-ahead logging so that readers
+    do not block the writer, enforced foreign keys like MySQL, and a busy
+    timeout instead of failing at once on a locked database"""
+    # transactions are begun by sqlite_begin, not by the driver
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout={:d}".format(
+        int(getenv('HBNB_SQLITE_BUSY_TIMEOUT', 5000))))
+    cursor.close()
+
+
+def sqlite_begin(connection):
+    """begins the transactions of SQLite connections, which the driver
+    would otherwise only begin before the first write"""
+    connection.exec_driver_sql("BEGIN")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool measuring how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.monotonic() - start
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+
+
+class RoutingSession(Session):
+    """Session asking the router in its info, if any, which engine runs
+    each of its SELECT statements. Flushes and other statements use the
+    engine the session is bound to"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        router = self.info.get("router")
+        if (router is not None and not self._flushing and
+                isinstance(clause, Select) and
+                clause._for_update_arg is None):
+            engine = router(self)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def pool_options(poolclass):
+    """returns the create_engine options for the pool read from the
+    environment: HBNB_DB_POOL_SIZE, HBNB_DB_MAX_OVERFLOW,
+    HBNB_DB_POOL_TIMEOUT (seconds), HBNB_DB_POOL_RECYCLE (seconds) and
+    HBNB_DB_POOL_PRE_PING (1 to test connections before using them)"""
+    options = {}
+    if getenv('HBNB_DB_POOL_PRE_PING') == "1":
+        options["pool_pre_ping"] = True
+    if getenv('HBNB_DB_POOL_RECYCLE') is not None:
+        options["pool_recycle"] = int(getenv('HBNB_DB_POOL_RECYCLE'))
+    if issubclass(poolclass, QueuePool):
+        for option, var, type in [("pool_size", 'HBNB_DB_POOL_SIZE', int),
+                                  ("max_overflow", 'HBNB_DB_MAX_OVERFLOW',
+                                   int),
+                                  ("pool_timeout", 'HBNB_DB_POOL_TIMEOUT',
+                                   float)]:
+            if getenv(var) is not None:
+                options[option] = type(getenv(var))
+    return options
+
+
+def query_cache():
+    """returns the query cache read from the environment, or None:
+    HBNB_CACHE is the backend (none, the default, memory or directory),
+    HBNB_CACHE_SIZE the number of results kept, HBNB_CACHE_TTL how long
+    they are kept (seconds) and HBNB_CACHE_DIR the directory shared by
+    the processes using the directory backend"""
+    kind = getenv('HBNB_CACHE', "none")
+    size = int(getenv('HBNB_CACHE_SIZE', 10000))
+    ttl = float(getenv('HBNB_CACHE_TTL', 30))
+    if kind == "memory":
+        return cache.QueryCache(cache.MemoryCache(size, ttl))
+    if kind == "directory":
+        path = getenv('HBNB_CACHE_DIR', os.path.join(
+            tempfile.gettempdir(), "hbnb_cache-" + getpass.getuser()))
+        return cache.QueryCache(cache.DirectoryCache(path, size, ttl))
+    return None
 
 
 class DBStorage:
@@ -32,25 +148,324 @@ class DBStorage:
         HBNB_MYSQL_HOST = getenv('HBNB_MYSQL_HOST')
         HBNB_MYSQL_DB = getenv('HBNB_MYSQL_DB')
         HBNB_ENV = getenv('HBNB_ENV')
-        self.__engine = create_engine('mysql+mysqldb://{}:{}@{}/{}'.
-                                      format(HBNB_MYSQL_USER,
-                                             HBNB_MYSQL_PWD,
-                                             HBNB_MYSQL_HOST,
-                                             HBNB_MYSQL_DB))
-        if HBNB_ENV == "test":
+        HBNB_DB_URL = getenv('HBNB_DB_URL')
+        if HBNB_DB_URL is None:
+            HBNB_DB_URL = 'mysql+mysqldb://{}:{}@{}/{}'.format(
+                HBNB_MYSQL_USER, HBNB_MYSQL_PWD, HBNB_MYSQL_HOST,
+                HBNB_MYSQL_DB)
+        self.__url = HBNB_DB_URL
+        self.__engine = self.__create_engine(HBNB_DB_URL)
+        self.__pool_lock = threading.Lock()
+        self.__pool_events = {"created": 0, "recycled": 0, "invalidated": 0}
+        event.listen(self.__engine, "connect", self.__pool_connect)
+        event.listen(self.__engine, "invalidate", self.__pool_invalidate)
+        # the read replicas, comma separated in HBNB_DB_READ_URLS
+        self.__replicas = [self.__create_engine(url.strip()) for url in
+                           getenv('HBNB_DB_READ_URLS', "").split(",")
+                           if url.strip()]
+        self.__next_replica = itertools.cycle(self.__replicas)
+        self.__sticky_seconds = float(getenv('HBNB_DB_STICKY_SECONDS', 5))
+        self.__sticky_lock = threading.Lock()
+        # when each client last committed a write, by client
+        self.__written = {}
+        self.__cache = query_cache()
+        # the reference objects, as (load time, {name: {id: object}}), and
+        # their version, increased by the commits changing them
+        self.__tier = None
+        self.__tier_version = 0
+        self.__tier_lock = threading.Lock()
+        self.__tier_ttl = float(getenv('HBNB_DB_REFERENCE_TTL', 60))
+        if HBNB_ENV == "test" and HBNB_DB_URL not in schemas:
+            # once per process: the tests then roll back their changes
             Base.metadata.drop_all(self.__engine)
 
-    def all(self, cls=None):
-        """query on the current database session"""
+    @staticmethod
+    def __create_engine(url):
+        """returns an engine connecting to the database URL"""
+        url = make_url(url)
+        options = {"poolclass": TimedQueuePool}
+        if url.get_backend_name() == "sqlite":
+            # the threaded Flask server shares connections between threads
+            options["connect_args"] = {"check_same_thread": False}
+            if url.database in (None, "", ":memory:"):
+                # each connection would open its own in-memory database
+                options["poolclass"] = StaticPool
+        options.update(pool_options(options["poolclass"]))
+        engine = create_engine(url, **options)
+        if url.get_backend_name() == "sqlite":
+            event.listen(engine, "connect", sqlite_connect)
+            event.listen(engine, "begin", sqlite_begin)
+        return engine
+
+    def __router(self, session):
+        """returns the replica running the reads of session, or None to
+        read from the primary database: when there is no replica, once
+        the session wrote, or while its client recently committed a write
+        that the replicas may not have received yet"""
+        if not self.__replicas or session.info.get("sticky"):
+            return None
+        if "replica" not in session.info:
+            written = self.__written.get(session.info.get("client"))
+            if (written is not None and
+                    time.monotonic() - written < self.__sticky_seconds):
+                session.info["sticky"] = True
+                return None
+            # a session keeps reading from the same replica
+            session.info["replica"] = next(self.__next_replica)
+        return session.info["replica"]
+
+    def __after_flush(self, session, flush_context):
+        """reads the rest of the session from the primary database, and
+        from the database rather than the reference objects and the cache
+        for the classes it changed"""
+        session.info["sticky"] = True
+        session.info["wrote"] = True
+        session.info.setdefault("changed", set()).update(
+            self.__changes(session))
+
+    def __after_commit(self, session):
+        """records when the client of session committed a write, drops
+        the reference objects if it changed one of them, and invalidates
+        the cached results of the classes it changed"""
+        changed = session.info.pop("changed", set())
+        if not changed.isdisjoint(reference):
+            with self.__tier_lock:
+                self.__tier = None
+                self.__tier_version += 1
+        if self.__cache is not None:
+            for name in changed:
+                self.__cache.backend.incr("hbnb:" + name)
+        if not session.info.pop("wrote", False):
+            return
+        now = time.monotonic()
+        with self.__sticky_lock:
+            if len(self.__written) >= 1024:
+                self.__written = {
+                    client: written
+                    for client, written in self.__written.items()
+                    if now - written < self.__sticky_seconds}
+            self.__written[session.info.get("client")] = now
+
+    def __after_rollback(self, session):
+        """forgets the changes rolled back"""
+        session.info.pop("changed", None)
+        session.info.pop("wrote", None)
+
+    @staticmethod
+    def __changes(session):
+        """returns the names of the classes of the objects session holds
+        changes to, flushed or not"""
+        changes = {type(obj).__name__ for obj in
+                   itertools.chain(session.new, session.dirty,
+                                   session.deleted)}
+        return changes | session.info.get("changed", set())
+
+    def __load_reference(self):
+        """returns the reference objects by class name and id, read from
+        the primary database and detached from their session"""
+        session = Session(bind=self.__engine, expire_on_commit=False)
+        try:
+            states = session.scalars(select(State).options(
+                selectinload(State.cities))).all()
+            amenities = session.scalars(select(Amenity)).all()
+            cities = [city for state in states for city in state.cities]
+            for city in cities:
+                # found in the identity map, without a query
+                city.state
+            session.expunge_all()
+        finally:
+            session.close()
+        return {"Amenity": {obj.id: obj for obj in amenities},
+                "City": {obj.id: obj for obj in cities},
+                "State": {obj.id: obj for obj in states}}
+
+    def __reference_tier(self):
+        """returns the reference objects by class name and id, loading
+        them if a commit changed them or they are older than
+        HBNB_DB_REFERENCE_TTL seconds. While one thread loads them, the
+        others keep using the previous ones if there are some"""
+        tier = self.__tier
+        if tier is not None and \
+                time.monotonic() - tier[0] < self.__tier_ttl:
+            return tier[1]
+        if not self.__tier_lock.acquire(blocking=tier is None):
+            return tier[1]
+        try:
+            tier = self.__tier
+            if tier is not None and \
+                    time.monotonic() - tier[0] < self.__tier_ttl:
+                return tier[1]
+            version = self.__tier_version
+        finally:
+            self.__tier_lock.release()
+        loaded_at = time.monotonic()
+        objects = self.__load_reference()
+        with self.__tier_lock:
+            # unless a commit changed them during the load
+            if version == self.__tier_version:
+                self.__tier = (loaded_at, objects)
+        return objects
+
+    def __reference(self, cls, load=None):
+        """returns the reference objects of cls by id, when the reference
+        tier can serve the current session with the relationships in
+        load, or None"""
+        name = getattr(cls, "__name__", cls)
+        if self.__tier_ttl <= 0 or name not in reference:
+            return None
+        for path in load or ():
+            if not isinstance(path, str):
+                return None
+            owner = name
+            for attr in path.split("."):
+                owner = reference[owner].get(attr)
+                if owner is None:
+                    return None
+        if not self.__changes(self.__session()).isdisjoint(reference):
+            return None
+        return self.__reference_tier()[name]
+
+    def __stale_tier(self):
+        """makes the next read of the reference tier load it again, after
+        the database had an object the tier did not"""
+        with self.__tier_lock:
+            if self.__tier is not None:
+                self.__tier = (float("-inf"), self.__tier[1])
+
+    def __merge(self, objs):
+        """returns the copies of the reference objects objs in the current
+        session, made without a query"""
+        return [self.__session.merge(obj, load=False) for obj in objs]
+
+    def __cached(self, clss, query, load, keep=None):
+        """returns the result of query on the classes clss, cached under a
+        key holding their versions, which their commits increase, and
+        whether a replica ran it, so that the sessions reading from the
+        primary database do not get results a replica may have missed
+        writes for. load runs the query on a miss, and always when the
+        cache is off or the session changed one of the classes; keep
+        tells which results are cached"""
+        names = [cls.__name__ for cls in clss]
+        session = self.__session()
+        if self.__cache is None or \
+                not self.__changes(session).isdisjoint(names):
+            return load()
+        backend = self.__cache.backend
+        source = "primary" if self.__router(session) is None else "replica"
+        key = "hbnb:{}:{}:{}".format(source, ",".join(
+            "{}.{:d}".format(name, backend.counter("hbnb:" + name))
+            for name in names), query)
+        return self.__cache.fetch(key, load, keep)
+
+    @staticmethod
+    def __dump(obj):
+        """returns the column values of obj, or None, to be cached"""
+        if obj is None:
+            return None
+        return {attr.key: getattr(obj, attr.key)
+                for attr in sqlalchemy.inspect(obj).mapper.column_attrs}
+
+    def __restore(self, cls, values):
+        """returns the object of class cls holding the cached column
+        values in the current session, made without a query"""
+        if values is None:
+            return None
+        obj = cls.__mapper__.class_manager.new_instance()
+        # the values are stored as loaded, bypassing the __setattr__ of
+        # the model, which would hash the password of a User again
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        return self.__session.merge(obj, load=False)
+
+    def cache_stats(self):
+        '''Returns the hits, misses and loads of the query cache, or None
+            when it is off
+        '''
+        if self.__cache is None:
+            return None
+        return self.__cache.stats()
+
+    def route(self, client=None, write=False):
+        '''Routes the current session, serving a request of client (such
+            as its address): its reads go to a read replica, unless write
+            is True or client committed a write in the last
+            HBNB_DB_STICKY_SECONDS, and go to the primary database once
+            it wrote
+        '''
+        session = self.__session()
+        session.info["client"] = client
+        if write:
+            session.info["sticky"] = True
+
+    def __loaders(self, cls, load):
+        """returns the loader options of a query of cls: the relationship
+        paths in load, such as "cities.places", are loaded with one
+        SELECT ... IN query per relationship; other SQLAlchemy loader
+        options, such as joinedload(Place.user), are used as they are"""
+        options = []
+        for path in load or ():
+            if not isinstance(path, str):
+                options.append(path)
+                continue
+            loader = None
+            owner = cls
+            for name in path.split("."):
+                attr = getattr(owner, name)
+                if loader is None:
+                    loader = selectinload(attr)
+                else:
+                    loader = loader.selectinload(attr)
+                owner = attr.property.mapper.class_
+            options.append(loader)
+        return options
+
+    def all(self, cls=None, load=None):
+        """query on the current database session. When cls is given, the
+        relationships in load are loaded with the objects"""
         new_dict = {}
         for clss in classes:
             if cls is None or cls is classes[clss] or cls is clss:
-                objs = self.__session.query(classes[clss]).all()
+                cached = self.__reference(clss, cls and load)
+                if cached is not None:
+                    objs = self.__merge(cached.values())
+                elif not (cls and load):
+                    objs = [self.__restore(classes[clss], values)
+                            for values in self.__cached(
+                                [classes[clss]], "all",
+                                lambda: [self.__dump(obj) for obj in
+                                         self.__session.query(
+                                             classes[clss]).all()])]
+                else:
+                    options = self.__loaders(classes[clss], load)
+                    objs = self.__session.query(classes[clss]).options(
+                        *options).all()
                 for obj in objs:
                     key = obj.__class__.__name__ + '.' + obj.id
                     new_dict[key] = obj
         return (new_dict)
 
+    def iterate(self, cls=None, chunk_size=1000):
+        """yields the objects of class cls (of all classes by default),
+        fetching chunk_size rows at a time through a server-side cursor so
+        that only the objects the caller keeps stay in memory. The session
+        should run no other query until the iteration ends"""
+        for clss in classes:
+            if cls is None or cls is classes[clss] or cls == clss:
+                cached = self.__reference(clss)
+                if cached is not None:
+                    objs = list(cached.values())
+                    for start in range(0, len(objs), chunk_size):
+                        yield from self.__merge(
+                            objs[start:start + chunk_size])
+                    continue
+                result = self.__session.scalars(select(
+                    classes[clss]).execution_options(yield_per=chunk_size))
+                try:
+                    yield from result
+                finally:
+                    result.close()
+
     def new(self, obj):
         """add the object to the current database session"""
         self.__session.add(obj)
@@ -64,28 +479,227 @@ class DBStorage:
         if obj is not None:
             self.__session.delete(obj)
 
+    def __session_factory(self, bind, **options):
+        """returns a factory of sessions bound to bind, recording the
+        writes of its sessions"""
+        sess_factory = sessionmaker(bind=bind, expire_on_commit=False,
+                                    class_=RoutingSession, **options)
+        event.listen(sess_factory, "after_flush", self.__after_flush)
+        event.listen(sess_factory, "after_commit", self.__after_commit)
+        event.listen(sess_factory, "after_rollback", self.__after_rollback)
+        return sess_factory
+
     def reload(self):
         """reloads data from the database"""
-        Base.metadata.create_all(self.__engine)
-        sess_factory = sessionmaker(bind=self.__engine, expire_on_commit=False)
+        if self.__url not in schemas:
+            Base.metadata.create_all(self.__engine)
+            schemas.add(self.__url)
+        sess_factory = self.__session_factory(self.__engine,
+                                              info={"router": self.__router})
         Session = scoped_session(sess_factory)
         self.__session = Session
 
+    @contextlib.contextmanager
+    def isolated(self):
+        '''Runs the block in a database transaction rolled back at its
+            end, which the sessions of the storage join, their commits
+            only releasing savepoints, so that a test leaves the database
+            as it found it. Replicas, the reference objects and the cache
+            are not used meanwhile
+        '''
+        self.__session.remove()
+        connection = self.__engine.connect()
+        transaction = connection.begin()
+        saved = (self.__session, self.__cache, self.__tier_ttl)
+        self.__session = scoped_session(self.__session_factory(
+            connection, join_transaction_mode="create_savepoint"))
+        self.__cache = None
+        self.__tier_ttl = 0
+        try:
+            yield
+        finally:
+            self.__session.remove()
+            transaction.rollback()
+            connection.close()
+            (self.__session, self.__cache, self.__tier_ttl) = saved
+
+    def migrate(self):
+        '''Brings the schema of an existing database up to date with the
+            models without dropping anything: creates the missing tables,
+            then the missing indexes, except where an existing index (such
+            as the one MySQL adds for a foreign key) or the primary key
+            already starts with the same columns. Returns the names of the
+            indexes created
+        '''
+        Base.metadata.create_all(self.__engine)
+        created = []
+        with self.__engine.begin() as connection:
+            inspector = sqlalchemy.inspect(connection)
+            for table in Base.metadata.sorted_tables:
+                existing = inspector.get_indexes(table.name)
+                names = {index["name"] for index in existing}
+                covering = [index["column_names"] for index in existing]
+                covering.append(inspector.get_pk_constraint(
+                    table.name)["constrained_columns"])
+                for index in sorted(table.indexes, key=lambda i: i.name):
+                    columns = [column.name for column in index.columns]
+                    if index.name in names or any(
+                            cols[:len(columns)] == columns
+                            for cols in covering):
+                        continue
+                    index.create(connection)
+                    created.append(index.name)
+        return created
+
     def get(self, cls, id):
         '''Returns the object based on the class and its ID,
             or None if not found
         '''
-        for obj in self.all(cls).values():
-            if obj.id == id:
-                return obj
-        return None
-
-    def count(self, cls=None):
-        '''Returns the number of objects in storage matching the given class.
-            If no class is passed, returns the count of all objects in
-            storate
+        if cls is None:
+            for clss in classes.values():
+                obj = self.get(clss, id)
+                if obj is not None:
+                    return obj
+            return None
+        cls = classes.get(cls, cls)
+        if cls not in classes.values() or id is None:
+            return None
+        cached = self.__reference(cls)
+        if cached is not None and id in cached:
+            return self.__merge([cached[id]])[0]
+        # looks in the identity map of the session before the cache
+        key = sqlalchemy.inspect(cls).identity_key_from_primary_key([id])
+        obj = self.__session.identity_map.get(key)
+        if obj is not None:
+            return obj
+        # a miss is not cached: another process may create the object
+        obj = self.__restore(cls, self.__cached(
+            [cls], "get:" + str(id),
+            lambda: self.__dump(self.__session.get(cls, id)),
+            lambda values: values is not None))
+        if cached is not None and obj is not None:
+            self.__stale_tier()
+        return obj
+
+    def get_many(self, cls, ids, load=None):
+        '''Returns the objects of the given class with the given IDs, in
+            the order of ids and skipping the ones not found, loading the
+            relationships in load with them
+        '''
+        cls = classes.get(cls, cls)
+        ids = [id for id in ids if id is not None]
+        if cls not in classes.values() or not ids:
+            return []
+        cached = self.__reference(cls, load)
+        if cached is not None:
+            missing = {id for id in ids if id not in cached}
+            if not missing:
+                return self.__merge([cached[id] for id in ids])
+        query = select(cls).where(cls.id.in_(set(ids))).options(
+            *self.__loaders(cls, load))
+        found = {obj.id: obj for obj in self.__session.scalars(query)}
+        if cached is not None and not missing.isdisjoint(found):
+            self.__stale_tier()
+        return [found[id] for id in ids if id in found]
+
+    def page(self, cls, limit, after=None, attr=None, value=None):
+        '''Returns at most limit objects of the given class in the order
+            of their IDs, starting after the ID after, and only the ones
+            whose attr equals value if attr is given. The keyset query
+            walks the primary key, or the index of attr, from the start of
+            the page, so every page costs the same
+        '''
+        cls = classes.get(cls, cls)
+        query = select(cls)
+        if attr is not None:
+            query = query.where(getattr(cls, attr) == value)
+        if after is not None:
+            query = query.where(cls.id > after)
+        return list(self.__session.scalars(
+            query.order_by(cls.id).limit(limit)))
+
+    def count(self, cls=None, attr=None, value=None):
+        '''Returns the number of objects in storage matching the given class,
+            and whose attr equals value if attr is given. If no class is
+            passed, returns the count of all objects in storate
+        '''
+        if attr is not None:
+            cls = classes.get(cls, cls)
+            return self.__cached(
+                [cls], "count:{}={}".format(attr, value),
+                lambda: self.__session.scalar(
+                    select(func.count()).select_from(cls).where(
+                        getattr(cls, attr) == value)))
+        if cls is None:
+            return sum(self.counts().values())
+        return self.counts([cls]).get(classes.get(cls, cls).__name__, 0)
+
+    def counts(self, clss=None):
+        '''Returns the number of objects of each of the given classes (all
+            of them by default) by class name, counted in one query
+        '''
+        if clss is None:
+            clss = classes.values()
+        clss = [classes.get(cls, cls) for cls in clss]
+        mapped = [cls for cls in clss if cls in classes.values()]
+        result = {cls.__name__: 0 for cls in clss}
+        for cls in list(mapped):
+            cached = self.__reference(cls)
+            if cached is not None:
+                result[cls.__name__] = len(cached)
+                mapped.remove(cls)
+        if mapped:
+            row = self.__cached(mapped, "counts", lambda: list(
+                self.__session.execute(select(*[
+                    select(func.count()).select_from(cls).scalar_subquery()
+                    for cls in mapped])).one()))
+            result.update(zip([cls.__name__ for cls in mapped], row))
+        return result
+
+    def is_dirty(self, obj):
+        '''Tells whether obj, or the session holding it, has changes that
+            were not committed, including the ones a query autoflushed
+        '''
+        session = self.__session
+        return (obj not in session or session.info.get("wrote", False) or
+                bool(session.new or session.deleted) or
+                any(session.is_modified(other) for other in session.dirty))
+
+    def __pool_connect(self, dbapi_connection, connection_record):
+        """counts a connection opened by the pool, replacing a recycled or
+        invalidated one if its record already had one"""
+        with self.__pool_lock:
+            if connection_record.record_info.get("hbnb_opened"):
+                self.__pool_events["recycled"] += 1
+            else:
+                connection_record.record_info["hbnb_opened"] = True
+                self.__pool_events["created"] += 1
+
+    def __pool_invalidate(self, dbapi_connection, connection_record,
+                          exception):
+        """counts a connection found broken"""
+        with self.__pool_lock:
+            self.__pool_events["invalidated"] += 1
+
+    def pool_stats(self):
+        '''Returns the state of the connection pool: its size, the
+            connections checked out and in overflow, the connections
+            created, recycled and invalidated, and how long checkouts
+            waited for a connection
         '''
-        return (len(self.all(cls)))
+        pool = self.__engine.pool
+        with self.__pool_lock:
+            stats = dict(self.__pool_events)
+        stats["pool"] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0))
+        if isinstance(pool, TimedQueuePool):
+            stats.update(checkouts=pool.checkouts,
+                         wait_ms=round(pool.wait_time * 1000, 3),
+                         max_wait_ms=round(pool.max_wait * 1000, 3))
+        return stats
 
     def close(self):
         """call remove() method on the private session attribute"""
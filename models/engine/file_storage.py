@@ -3,19 +3,67 @@
 Contains the FileStorage class
 """
 
-import json
+import atexit
+import bisect
+import contextlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+import io
 from models.amenity import Amenity
 from models.base_model import BaseModel
 from models.city import City
+from models.engine import codec, snapshot
 from models.place import Place
 from models.review import Review
 from models.state import State
 from models.user import User
+from os import getenv
+import os
+import threading
+import zlib
 
 classes = {"Amenity": Amenity, "BaseModel": BaseModel, "City": City,
            "Place": Place, "Review": Review, "State": State, "User": User}
 
 
+# foreign keys reverse indexed by the storage, by class name
+relations = {"City": ("state_id",), "Place": ("city_id", "user_id"),
+             "Review": ("place_id", "user_id")}
+
+
+def stat(path):
+    """returns (device, inode, size, mtime) of path, or None if it does
+    not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def running(pid):
+    """tells whether the process pid may still be running: always when
+    the platform cannot tell"""
+    if pid == os.getpid() or os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def class_name(cls):
+    """returns the name of cls, which is either a class or its name"""
+    if isinstance(cls, str):
+        return cls
+    return cls.__name__
+
+
 class FileStorage:
     """serializes instances to a JSON file & deserializes back to instances"""
 
@@ -23,64 +71,1014 @@ class FileStorage:
     __file_path = "file.json"
     # dictionary - empty but will store all objects by <class name>.id
     __objects = {}
+    # dictionary - the keys stored, partitioned by class name, mapped to
+    # their object (None until it is built from its record)
+    __by_class = {}
+    # dictionary - (class name, foreign key) -> foreign key value -> keys
+    __related = {}
+    # dictionary - the keys of a class partition, (class name,), or of a
+    # foreign key index entry, (class name, foreign key, value), in
+    # order; only kept for the ones paged through
+    __order = {}
+    # dictionary - records read from disk whose object was not built yet,
+    # by key, and the __objects dictionary they belong to
+    __lazy = {}
+    __lazy_owner = __objects
+    # the __objects dictionary (and its size) the indexes were built from
+    __indexed = __objects
+    __size = 0
+    # string - "single" keeps every object in the JSON file, "sharded"
+    # keeps one file per class, or per class and bucket of ids when
+    # __buckets is more than 1, in the <__file_path>.d directory
+    __layout = getenv("HBNB_FILE_LAYOUT", "single")
+    __buckets = int(getenv("HBNB_FILE_BUCKETS", 1))
+    # string - "json" writes snapshots as JSON, "binary" in the indexed
+    # format of models.engine.snapshot; either is read back
+    __format = getenv("HBNB_FILE_FORMAT", "json")
+    # boolean - append changes to <__file_path>.log instead of rewriting
+    # the whole JSON file on every save
+    __journal = getenv("HBNB_FILE_JOURNAL") == "1"
+    # set - keys of the objects created, updated or deleted since the
+    # last save
+    __dirty = set()
+    # dictionary - the to_dict(False) record last read or written for each
+    # key, so that saves only serialize the objects in __dirty
+    __records = {}
+    # boolean - whether the next save must write a full snapshot
+    __rewrite = False
+    # the journal is compacted into a new snapshot once it is larger than
+    # __compact_bytes or than __compact_ratio times the JSON file
+    __compact_bytes = int(getenv("HBNB_FILE_COMPACT_BYTES", 4 * 1024 * 1024))
+    __compact_ratio = float(getenv("HBNB_FILE_COMPACT_RATIO", 1.0))
+    # lock serializing the writers of the JSON file and of the journal
+    __lock = threading.RLock()
+    # lock guarding __objects and the indexes. It is only held for short
+    # in-memory updates, never while the files are written; __objects is
+    # copied before a change once all() handed it out (it is then
+    # __shared), so that readers iterate over a dictionary that does not
+    # change
+    __mutex = threading.RLock()
+    __shared = None
+    # the processes sharing the files serialize their writes with an
+    # advisory lock on <__file_path>.lock, which holds the number of
+    # saves made (the generation of the files). __generation is the one
+    # this process last read or wrote, __lock_fd the lock file while
+    # this process holds the lock
+    __generation = 0
+    __lock_fd = None
+    # number of full snapshots written, and the running compaction thread
+    __snapshots = 0
+    __compactor = None
+    # stat() of the JSON file (or of the manifest of the shards) when it
+    # was last read or written, the
+    # (device, inode) of the journal and how many of its bytes were applied
+    __snapshot_stamp = None
+    __journal_stamp = None
+    __applied = 0
+    # string - when saves reach the disk: "sync" writes on every save,
+    # "interval" lets a background thread write every __flush_ms
+    # milliseconds and "group" makes concurrent saves share one write
+    __durability = getenv("HBNB_FILE_DURABILITY", "sync")
+    __flush_ms = int(getenv("HBNB_FILE_FLUSH_MS", 100))
+    # condition guarding the save counters below and the flusher thread
+    __flush_cond = threading.Condition()
+    __saves = 0
+    __flushed = 0
+    __flushing = False
+    __flushes = 0
+    __coalesced = 0
+    __flusher = None
+    # the writes started, and the (attempt, target, error) of the last
+    # one that failed, for the saves waiting on it to raise its error
+    __attempts = 0
+    __flush_error = None
+
+    def __partitions(self):
+        """returns __by_class, rebuilding the indexes when __objects was
+        replaced or resized without going through the storage"""
+        objects = self.__objects
+        if objects is not self.__indexed or len(objects) != self.__size:
+            FileStorage.__by_class = {}
+            FileStorage.__related = {}
+            FileStorage.__order = {}
+            for key, obj in objects.items():
+                self.__link(key, obj)
+            if objects is self.__lazy_owner:
+                for key, record in self.__lazy.items():
+                    if key not in objects:
+                        self.__link(key, None, record)
+            FileStorage.__indexed = objects
+            FileStorage.__size = len(objects)
+            FileStorage.__rewrite = True
+        return self.__by_class
+
+    def __foreign_key(self, name, attr, obj, record):
+        """returns the value of the foreign key attr of obj, or of record
+        when the object is not loaded"""
+        if obj is not None:
+            return getattr(obj, attr, None)
+        return record.get(attr, getattr(classes.get(name), attr, None))
+
+    def __link(self, key, obj, record=None):
+        """adds the object stored under key (None while only its record
+        is loaded) to its class partition and foreign key indexes"""
+        name = key.split(".", 1)[0]
+        self.__by_class.setdefault(name, {})[key] = obj
+        self.__order_add((name,), key)
+        for attr in relations.get(name, ()):
+            index = self.__related.setdefault((name, attr), {})
+            value = self.__foreign_key(name, attr, obj, record)
+            index.setdefault(value, {})[key] = None
+            self.__order_add((name, attr, value), key)
+
+    def __unlink(self, key):
+        """removes the object stored under key from its class partition
+        and foreign key indexes"""
+        name = key.split(".", 1)[0]
+        obj = self.__objects.get(key)
+        record = self.__lazy.get(key, {})
+        self.__by_class.get(name, {}).pop(key, None)
+        self.__order_remove((name,), key)
+        for attr in relations.get(name, ()):
+            index = self.__related.get((name, attr), {})
+            value = self.__foreign_key(name, attr, obj, record)
+            index.get(value, {}).pop(key, None)
+            self.__order_remove((name, attr, value), key)
+
+    def __order_add(self, entry, key):
+        """adds key to the ordered keys of entry, if they are kept"""
+        keys = self.__order.get(entry)
+        if keys is not None:
+            i = bisect.bisect_left(keys, key)
+            if i == len(keys) or keys[i] != key:
+                keys.insert(i, key)
+
+    def __order_remove(self, entry, key):
+        """removes key from the ordered keys of entry, if they are kept"""
+        keys = self.__order.get(entry)
+        if keys is not None:
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def __ordered(self, name, attr=None, value=None):
+        """returns the keys of class name, or of its objects whose foreign
+        key attr is value, in order. They are then kept in order as
+        objects come and go"""
+        partitions = self.__partitions()
+        if attr is None:
+            entry = (name,)
+            keys = partitions.get(name, {})
+        else:
+            entry = (name, attr, value)
+            keys = self.__related.get((name, attr), {}).get(value, {})
+        if entry not in self.__order:
+            self.__order[entry] = sorted(keys)
+        return self.__order[entry]
+
+    def __writable(self):
+        """returns __objects, first replacing it with a copy if all()
+        handed it out"""
+        objects = self.__objects
+        if objects is self.__shared:
+            copy = dict(objects)
+            if self.__indexed is objects:
+                FileStorage.__indexed = copy
+            if self.__lazy_owner is objects:
+                FileStorage.__lazy_owner = copy
+            FileStorage.__objects = copy
+            FileStorage.__shared = None
+            objects = copy
+        return objects
+
+    def __put(self, key, obj):
+        """stores obj under key in __objects and in the indexes"""
+        self.__partitions()
+        if self.__stored(key):
+            self.__unlink(key)
+            self.__lazy.pop(key, None)
+        self.__writable()[key] = obj
+        self.__link(key, obj)
+        FileStorage.__size = len(self.__objects)
+        self.__records.pop(key, None)
+
+    def __put_record(self, key, record):
+        """stores a record read from disk under key; the object is only
+        built from it the first time it is accessed"""
+        self.__adopt()
+        self.__partitions()
+        if self.__stored(key):
+            self.__unlink(key)
+            self.__writable().pop(key, None)
+            FileStorage.__size = len(self.__objects)
+        self.__lazy[key] = record
+        self.__records[key] = record
+        self.__link(key, None, record)
+
+    def __adopt(self):
+        """ties __lazy to the current __objects dictionary, first building
+        the objects of the records left for the one it was tied to"""
+        owner = self.__lazy_owner
+        if owner is not self.__objects:
+            for key, record in list(self.__lazy.items()):
+                owner.setdefault(key, classes[record["__class__"]](**record))
+            FileStorage.__lazy = {}
+            FileStorage.__lazy_owner = self.__objects
 
-    def all(self, cls=None):
-        """returns the dictionary __objects"""
-        if cls is not None:
-            new_dict = {}
-            for key, value in self.__objects.items():
-                if cls == value.__class__ or cls == value.__class__.__name__:
-                    new_dict[key] = value
-            return new_dict
-        return self.__objects
+    def __stored(self, key):
+        """tells whether an object, loaded or not, is stored under key"""
+        return key in self.__objects or (
+            key in self.__lazy and self.__lazy_owner is self.__objects)
+
+    def __fetch(self, key):
+        """returns the object stored under key, building it from its
+        record if needed, or None"""
+        obj = self.__objects.get(key)
+        if obj is not None or self.__lazy_owner is not self.__objects:
+            return obj
+        record = self.__lazy.get(key)
+        if record is None:
+            return self.__objects.get(key)
+        obj = classes[record["__class__"]](**record)
+        obj = self.__writable().setdefault(key, obj)
+        self.__by_class.setdefault(key.split(".", 1)[0], {})[key] = obj
+        self.__lazy.pop(key, None)
+        FileStorage.__size = len(self.__objects)
+        return obj
+
+    def __drop(self, key):
+        """removes the object stored under key from __objects and the
+        indexes"""
+        if self.__stored(key):
+            self.__partitions()
+            self.__unlink(key)
+            self.__writable().pop(key, None)
+            self.__lazy.pop(key, None)
+            FileStorage.__size = len(self.__objects)
+        self.__records.pop(key, None)
+
+    def all(self, cls=None, load=None):
+        """returns the dictionary __objects. It does not change afterwards:
+        the storage changes a copy of it instead. load is accepted for
+        compatibility with DBStorage: relationships are always indexed"""
+        with self.__mutex:
+            if cls is not None:
+                partition = self.__partitions().get(class_name(cls), {})
+                return {key: obj if obj is not None else self.__fetch(key)
+                        for key, obj in list(partition.items())}
+            if self.__lazy and self.__lazy_owner is self.__objects:
+                self.__partitions()
+                for key in list(self.__lazy):
+                    self.__fetch(key)
+            FileStorage.__shared = self.__objects
+            return self.__objects
+
+    def iterate(self, cls=None, chunk_size=1000):
+        """yields the objects of class cls (of all classes by default),
+        building chunk_size of them at a time so that the storage is only
+        locked while a chunk is built. The objects deleted during the
+        iteration are skipped, the ones added may be"""
+        with self.__mutex:
+            partitions = self.__partitions()
+            if cls is not None:
+                partitions = [partitions.get(class_name(cls), {})]
+            else:
+                partitions = list(partitions.values())
+            keys = [key for partition in partitions for key in partition]
+        for start in range(0, len(keys), chunk_size):
+            with self.__mutex:
+                self.__partitions()
+                chunk = [self.__fetch(key)
+                         for key in keys[start:start + chunk_size]
+                         if self.__stored(key)]
+            yield from chunk
 
     def new(self, obj):
         """sets in __objects the obj with key <obj class name>.id"""
         if obj is not None:
             key = obj.__class__.__name__ + "." + obj.id
-            self.__objects[key] = obj
+            with self.__mutex:
+                self.__put(key, obj)
+                self.__dirty.add(key)
+
+    def __lock_path(self):
+        """returns the path of the lock file kept next to the JSON file"""
+        return self.__file_path + ".lock"
+
+    @contextlib.contextmanager
+    def __locked(self, exclusive=True):
+        """holds the lock of the files across processes, exclusively to
+        write them or shared to read them. Called with __lock held"""
+        if fcntl is None or self.__lock_fd is not None:
+            yield
+            return
+        flags = os.O_RDWR | (os.O_CREAT if exclusive else 0)
+        try:
+            fd = os.open(self.__lock_path(), flags, 0o644)
+        except OSError:
+            # nothing was saved with the lock yet
+            yield
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            FileStorage.__lock_fd = fd
+            yield
+        finally:
+            FileStorage.__lock_fd = None
+            os.close(fd)
+
+    def __committed(self):
+        """returns the generation of the files"""
+        try:
+            with open(self.__lock_path(), 'rb') as f:
+                return int(f.read(32) or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def __commit(self):
+        """counts a write in the generation of the files. Called with the
+        lock held exclusively"""
+        if self.__lock_fd is not None:
+            generation = self.__committed() + 1
+            os.pwrite(self.__lock_fd, b"%020d\n" % generation, 0)
+            FileStorage.__generation = generation
+
+    def __changed(self):
+        """tells whether the files were changed since this process last
+        read or wrote them"""
+        return (self.__committed() != self.__generation or
+                stat(self.__snapshot_path()) != self.__snapshot_stamp or
+                not self.__journal_in_sync())
+
+    def __refresh(self):
+        """brings __objects up to date with the files when another process
+        changed them, keeping the changes not saved yet. Called with
+        __lock held"""
+        with self.__mutex:
+            self.__partitions()
+            if self.__rewrite:
+                # __objects was replaced: it overrides the files
+                return
+            keep = set(self.__dirty)
+        generation = self.__committed()
+        if stat(self.__snapshot_path()) == self.__snapshot_stamp:
+            journal = stat(self.__journal_path())
+            if self.__journal_in_sync() or (
+                    journal is not None and journal[2] >= self.__applied and
+                    self.__journal_stamp in (None, journal[:2])):
+                # at most new journal lines to apply
+                self.__replay_journal(keep)
+                FileStorage.__generation = generation
+                return
+        seen = set()
+        self.__load(keep, seen)
+        with self.__mutex:
+            stored = list(self.__objects)
+            if self.__lazy_owner is self.__objects:
+                stored.extend(self.__lazy)
+            for key in stored:
+                if key not in seen and key not in keep:
+                    # deleted by another process
+                    self.__drop(key)
+        FileStorage.__generation = generation
+
+    def __journal_path(self):
+        """returns the path of the journal kept next to the JSON file"""
+        return self.__file_path + ".log"
+
+    def __shard_dir(self):
+        """returns the directory holding the shards"""
+        return self.__file_path + ".d"
+
+    def __snapshot_path(self):
+        """returns the file replaced on every snapshot write: the JSON
+        file, or the manifest of the shards"""
+        if self.__layout == "sharded":
+            return os.path.join(self.__shard_dir(), "MANIFEST")
+        return self.__file_path
+
+    def __shard(self, key):
+        """returns the name of the shard file holding key"""
+        name, _, id = key.partition(".")
+        if self.__buckets > 1:
+            name += "." + str(zlib.crc32(id.encode()) % self.__buckets)
+        return name + ".json"
+
+    def __dump(self, records, path):
+        """writes records to path in __format and flushes it to disk"""
+        if self.__format == "binary":
+            with open(path, 'wb') as f:
+                snapshot.dump_records(records, f, relations)
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        with open(path, 'w', encoding="utf-8") as f:
+            codec.dump_records(records, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __read(self, path, keep=(), seen=None):
+        """replays the records of the snapshot at path, JSON or binary,
+        and returns its stat()"""
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if snapshot.is_snapshot(f):
+                self.__replay(snapshot.iter_records(f), keep, seen)
+            else:
+                text = io.TextIOWrapper(f, encoding="utf-8")
+                try:
+                    self.__replay(codec.iter_records(text), keep, seen)
+                finally:
+                    text.detach()
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def __prepare(self, records, shards=None, suffix=".tmp"):
+        """writes records to temporary files for __swap to rename over the
+        JSON file, or over the shards holding them (or the given shards).
+        Returns the (temporary path, path) pairs"""
+        if self.__layout != "sharded":
+            self.__dump(records, self.__file_path + suffix)
+            return [(self.__file_path + suffix, self.__file_path)]
+        grouped = {shard: {} for shard in shards or ()}
+        for key, record in records.items():
+            grouped.setdefault(self.__shard(key), {})[key] = record
+        os.makedirs(self.__shard_dir(), exist_ok=True)
+        pairs = []
+        for shard, shard_records in grouped.items():
+            path = os.path.join(self.__shard_dir(), shard)
+            self.__dump(shard_records, path + suffix)
+            pairs.append((path + suffix, path))
+        return pairs
+
+    def __swap(self, pairs, full=True):
+        """renames the files written by __prepare into place. In the
+        sharded layout, a full swap also removes the shards it did not
+        write, then the manifest listing the shards is replaced"""
+        for tmp, path in pairs:
+            os.replace(tmp, path)
+        if self.__layout != "sharded":
+            return
+        written = {os.path.basename(path) for tmp, path in pairs}
+        shards = set(written)
+        for name in os.listdir(self.__shard_dir()):
+            if name.endswith(".json") and name not in written:
+                if full:
+                    os.remove(os.path.join(self.__shard_dir(), name))
+                else:
+                    shards.add(name)
+        manifest = self.__snapshot_path()
+        with open(manifest + ".tmp", 'w', encoding="utf-8") as f:
+            f.write(codec.dumps({"buckets": self.__buckets,
+                                 "shards": sorted(shards)}))
+        os.replace(manifest + ".tmp", manifest)
+
+    def __record(self, key):
+        """returns the record of the object stored under key, serializing
+        the object if it changed since it was last read or written"""
+        record = self.__records.get(key)
+        if record is None or key in self.__dirty:
+            record = self.__objects[key].to_dict(False)
+            self.__records[key] = record
+        return record
+
+    def __snapshot_records(self, shards=None):
+        """returns the records of every object stored, loaded or not, or
+        only of those in the given shards"""
+        if shards is None:
+            keys = list(self.__objects)
+        else:
+            partitions = self.__partitions()
+            keys = []
+            for name in {shard.split(".")[0] for shard in shards}:
+                keys.extend(key for key in list(partitions.get(name, ()))
+                            if self.__shard(key) in shards)
+        lazy = self.__lazy if self.__lazy_owner is self.__objects else {}
+        json_objects = {key: self.__record(key) for key in keys
+                        if key not in lazy}
+        if shards is None:
+            json_objects.update(lazy)
+        else:
+            json_objects.update((key, lazy[key]) for key in keys
+                                if key in lazy)
+        return json_objects
+
+    def __dirty_shards(self, keys):
+        """returns the shards holding keys, or None when the whole
+        snapshot must be written: in the single file layout, or when
+        there is a journal to empty"""
+        if keys is None or self.__layout != "sharded" or \
+                os.path.exists(self.__journal_path()):
+            return None
+        return {self.__shard(key) for key in keys}
+
+    def __write_snapshot(self, records, shards=None):
+        """writes records (from __snapshot_records) to the JSON file, or to
+        the given shards, and empties the journal"""
+        self.__swap(self.__prepare(records, shards), shards is None)
+        if os.path.exists(self.__journal_path()):
+            open(self.__journal_path(), 'w').close()
+        FileStorage.__snapshots += 1
+        FileStorage.__snapshot_stamp = stat(self.__snapshot_path())
+        journal = stat(self.__journal_path())
+        FileStorage.__journal_stamp = journal and journal[:2]
+        FileStorage.__applied = 0
+
+    def __journal_lines(self, keys):
+        """returns one journal line per key: {key: record} for objects in
+        __objects, {key: null} for deleted ones"""
+        lines = []
+        for key in keys:
+            record = self.__record(key) if self.__stored(key) else None
+            lines.append(codec.dumps({key: record}) + "\n")
+        return lines
+
+    def __append_journal(self, lines):
+        """appends lines to the journal"""
+        if lines:
+            in_sync = self.__journal_in_sync()
+            with open(self.__journal_path(), 'a', encoding="utf-8") as f:
+                f.write("".join(lines))
+                end = f.tell()
+            if in_sync:
+                journal = stat(self.__journal_path())
+                FileStorage.__journal_stamp = journal[:2]
+                FileStorage.__applied = end
+
+    def __journal_in_sync(self):
+        """tells whether every byte of the journal was applied"""
+        journal = stat(self.__journal_path())
+        if journal is None:
+            return self.__journal_stamp is None
+        return (journal[:2] == self.__journal_stamp and
+                journal[2] == self.__applied)
+
+    def __replay(self, records, keep=(), seen=None):
+        """applies (key, record or None) pairs to __objects, except to the
+        keys in keep. The keys are added to seen"""
+        for key, record in records:
+            if seen is not None:
+                seen.add(key)
+            if key in keep:
+                continue
+            with self.__mutex:
+                if record is None:
+                    self.__drop(key)
+                else:
+                    self.__put_record(key, record)
 
     def save(self):
         """serializes __objects to the JSON file (path: __file_path)"""
-        json_objects = {}
-        for key in self.__objects:
-            json_objects[key] = self.__objects[key].to_dict(False)
-        with open(self.__file_path, 'w') as f:
-            json.dump(json_objects, f)
+        with self.__flush_cond:
+            FileStorage.__saves += 1
+            ticket = self.__saves
+            if self.__durability == "interval":
+                self.__start_flusher()
+                return
+            if self.__durability == "group":
+                while self.__flushed < ticket:
+                    if self.__flushing:
+                        # a write is in progress: wait for the next one,
+                        # which covers this save and the ones arriving
+                        # meanwhile
+                        attempts = self.__attempts
+                        self.__flush_cond.wait()
+                        failed = self.__flush_error
+                        if (failed is not None and failed[0] > attempts and
+                                failed[1] >= ticket):
+                            raise failed[2]
+                    else:
+                        self.__flush_pending()
+                return
+        self.__flush()
+        with self.__flush_cond:
+            FileStorage.__flushed = max(self.__flushed, ticket)
+            FileStorage.__flushes += 1
+
+    def __flush_pending(self):
+        """writes every save requested so far. Called, and returns, with
+        __flush_cond held, but releases it while writing"""
+        target = self.__saves
+        FileStorage.__flushing = True
+        FileStorage.__attempts += 1
+        attempt = self.__attempts
+        self.__flush_cond.release()
+        try:
+            self.__flush()
+        except BaseException as error:
+            self.__flush_cond.acquire()
+            # the saves this write covered were not written
+            FileStorage.__flush_error = (attempt, target, error)
+            raise
+        else:
+            self.__flush_cond.acquire()
+            FileStorage.__coalesced += max(target - self.__flushed - 1, 0)
+            FileStorage.__flushed = max(self.__flushed, target)
+            FileStorage.__flushes += 1
+        finally:
+            FileStorage.__flushing = False
+            self.__flush_cond.notify_all()
+
+    def __start_flusher(self):
+        """starts the background thread of the "interval" durability mode
+        if it is not running"""
+        if self.__flusher is None:
+            # write what is left when the interpreter exits
+            atexit.register(self.flush)
+        if self.__flusher is None or not self.__flusher.is_alive():
+            FileStorage.__flusher = threading.Thread(target=self.__flush_loop,
+                                                     daemon=True)
+            self.__flusher.start()
+
+    def __flush_loop(self):
+        """body of the flusher thread: writes pending saves every
+        __flush_ms milliseconds, until the durability mode changes"""
+        while self.__durability == "interval":
+            with self.__flush_cond:
+                self.__flush_cond.wait(self.__flush_ms / 1000)
+                if self.__flushed < self.__saves and not self.__flushing:
+                    self.__flush_pending()
+
+    def flush(self):
+        '''Writes the saves the durability mode left pending
+        '''
+        with self.__flush_cond:
+            while self.__flushing:
+                self.__flush_cond.wait()
+            if self.__flushed < self.__saves:
+                self.__flush_pending()
+
+    def flush_stats(self):
+        '''Returns the durability mode, the number of saves requested,
+            of writes made for them, and of saves coalesced into another
+            save's write
+        '''
+        with self.__flush_cond:
+            return {"mode": self.__durability, "saves": self.__saves,
+                    "flushes": self.__flushes,
+                    "coalesced": self.__coalesced}
+
+    def __flush(self):
+        """writes the changes to the JSON file or the journal. The objects
+        are locked while their records are captured, not while the
+        records are written"""
+        with self.__lock, self.__locked():
+            if self.__changed():
+                # merge the saves of the other processes first
+                self.__refresh()
+            with self.__mutex:
+                self.__partitions()
+                dirty = set(self.__dirty)
+                rewrite = self.__rewrite
+                if rewrite:
+                    FileStorage.__records = {}
+                append = self.__journal and not rewrite
+                if append:
+                    lines = self.__journal_lines(dirty)
+                else:
+                    shards = self.__dirty_shards(None if rewrite else dirty)
+                    records = self.__snapshot_records(shards)
+                for key in dirty:
+                    if key not in self.__objects:
+                        self.__records.pop(key, None)
+                self.__dirty.difference_update(dirty)
+                FileStorage.__rewrite = False
+            try:
+                if append:
+                    self.__append_journal(lines)
+                else:
+                    self.__write_snapshot(records, shards)
+                self.__commit()
+            except BaseException:
+                with self.__mutex:
+                    self.__dirty.update(dirty)
+                    FileStorage.__rewrite = self.__rewrite or rewrite
+                raise
+        if self.__journal and self.__journal_too_large():
+            self.compact()
+
+    def __journal_too_large(self):
+        """tells whether the journal crossed a compaction threshold"""
+        try:
+            size = os.path.getsize(self.__journal_path())
+        except OSError:
+            return False
+        snapshot = 0
+        paths = [self.__file_path]
+        if self.__layout == "sharded":
+            try:
+                paths = [os.path.join(self.__shard_dir(), name)
+                         for name in os.listdir(self.__shard_dir())]
+            except OSError:
+                paths = []
+        for path in paths:
+            try:
+                snapshot += os.path.getsize(path)
+            except OSError:
+                pass
+        return (size > self.__compact_bytes or
+                size > self.__compact_ratio * max(snapshot, 1024))
+
+    def compact(self, wait=False):
+        '''Writes a consolidated snapshot of the JSON file and the
+            journal in a background thread, then swaps it in and
+            truncates the journal. Returns the compaction thread
+        '''
+        with self.__lock:
+            compactor = self.__compactor
+            if compactor is None or not compactor.is_alive():
+                compactor = threading.Thread(target=self.__compact,
+                                             daemon=True)
+                FileStorage.__compactor = compactor
+                compactor.start()
+        if wait:
+            compactor.join()
+        return compactor
+
+    def __remove_stale_compactions(self):
+        """removes the temporary files of the compactions that processes
+        which exited did not finish"""
+        base = os.path.basename(self.__file_path) + ".compact."
+        for directory, prefix in [
+                (os.path.dirname(os.path.abspath(self.__file_path)), base),
+                (self.__shard_dir(), "")]:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                head, sep, pid = name.rpartition(".compact.")
+                if not sep or not name.startswith(prefix) or \
+                        not pid.isdigit() or running(int(pid)):
+                    continue
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def __compact(self):
+        """body of the compaction thread. Only capturing the objects and
+        swapping the files in hold the lock; requests keep reading and
+        writing the storage while the snapshot is serialized"""
+        log = self.__journal_path()
+        with self.__lock, self.__locked():
+            self.__remove_stale_compactions()
+            self.__flush()
+            with self.__mutex:
+                records = self.__snapshot_records()
+            generation = self.__snapshots
+            stamp = stat(self.__snapshot_path())
+            try:
+                offset = os.path.getsize(log)
+            except OSError:
+                offset = 0
+        pairs = self.__prepare(records, None, ".compact.%d" % os.getpid())
+        with self.__lock, self.__locked():
+            if generation != self.__snapshots or \
+                    stat(self.__snapshot_path()) != stamp:
+                # a full snapshot was saved meanwhile; ours is stale
+                for tmp, path in pairs:
+                    os.remove(tmp)
+                return
+            try:
+                with open(log, 'rb') as f:
+                    f.seek(offset)
+                    tail = f.read()
+            except OSError:
+                tail = b""
+            in_sync = self.__journal_in_sync()
+            # once the snapshot is swapped in, replaying the whole journal
+            # on top of it yields the same objects, so a crash before the
+            # journal is rewritten loses nothing
+            self.__swap(pairs)
+            with open(log + ".tmp", 'wb') as f:
+                f.write(tail)
+            os.replace(log + ".tmp", log)
+            FileStorage.__snapshot_stamp = (stat(self.__snapshot_path())
+                                            if in_sync else None)
+            FileStorage.__journal_stamp = stat(log)[:2]
+            FileStorage.__applied = len(tail)
+            self.__commit()
 
     def reload(self):
-        """deserializes the JSON file to __objects"""
+        """deserializes the JSON file, or the shards, to __objects, then
+        replays the journal on top of it. Objects are only built from
+        their records the first time they are accessed"""
+        with self.__lock, self.__locked(False):
+            FileStorage.__generation = self.__committed()
+            self.__load()
+
+    def __load(self, keep=(), seen=None):
+        """replays the snapshot and the journal, except for the keys in
+        keep, adding the keys read to seen"""
+        FileStorage.__snapshot_stamp = None
+        if self.__layout == "sharded" and \
+                os.path.exists(self.__snapshot_path()):
+            self.__reload_shards(keep, seen)
+        else:
+            try:
+                stamp = self.__read(self.__file_path, keep, seen)
+                if self.__layout == "sharded":
+                    # first run with shards: split the JSON file on the
+                    # next save
+                    FileStorage.__rewrite = True
+                else:
+                    FileStorage.__snapshot_stamp = stamp
+            except Exception:
+                pass
+        FileStorage.__journal_stamp = None
+        FileStorage.__applied = 0
+        self.__replay_journal(keep, seen)
+
+    def __reload_shards(self, keep=(), seen=None):
+        """deserializes the shards listed in the manifest. A shard that
+        cannot be read does not prevent reading the others"""
+        try:
+            with open(self.__snapshot_path(), 'r', encoding="utf-8") as f:
+                st = os.fstat(f.fileno())
+                manifest = codec.loads(f.read())
+        except (OSError, ValueError):
+            return
+        FileStorage.__snapshot_stamp = (st.st_dev, st.st_ino, st.st_size,
+                                        st.st_mtime_ns)
+        if manifest.get("buckets") != self.__buckets:
+            # the ids are spread over another number of buckets
+            FileStorage.__rewrite = True
+        for shard in manifest.get("shards", []):
+            try:
+                self.__read(os.path.join(self.__shard_dir(), shard), keep,
+                            seen)
+            except Exception:
+                continue
+
+    def reshard(self):
+        '''Writes every object to the shards of the sharded layout and
+            switches to it. The JSON file is left as it was
+        '''
+        self.flush()
+        with self.__lock, self.__locked():
+            if self.__changed():
+                self.__refresh()
+            with self.__mutex:
+                self.__partitions()
+                FileStorage.__layout = "sharded"
+                records = self.__snapshot_records()
+            self.__write_snapshot(records)
+            self.__commit()
+
+    def __replay_journal(self, keep=(), seen=None):
+        """replays the journal lines that were not applied yet"""
         try:
-            with open(self.__file_path, 'r') as f:
-                jo = json.load(f)
-            for key in jo:
-                self.__objects[key] = classes[jo[key]["__class__"]](**jo[key])
-        except Exception:
-            pass
+            f = open(self.__journal_path(), 'rb')
+        except OSError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            FileStorage.__journal_stamp = (st.st_dev, st.st_ino)
+            f.seek(self.__applied)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # not fully written yet: applied on a later call
+                    break
+                FileStorage.__applied += len(line)
+                try:
+                    self.__replay(codec.loads(line).items(), keep, seen)
+                except (ValueError, KeyError):
+                    # a line cut short by a crash during an append
+                    continue
 
     def get(self, cls, id):
         '''Returns the object based on the class and its ID,
             or None if not found
         '''
-        for obj in self.all(cls).values():
-            if obj.id == id:
-                return obj
+        if cls is None or type(id) is not str:
+            for obj in self.all(cls).values():
+                if obj.id == id:
+                    return obj
+            return None
+        name = class_name(cls)
+        key = name + "." + id
+        with self.__mutex:
+            if key in self.__partitions().get(name, {}):
+                return self.__fetch(key)
         return None
 
-    def count(self, cls=None):
+    def get_many(self, cls, ids, load=None):
+        '''Returns the objects of the given class with the given IDs, in
+            the order of ids and skipping the ones not found
+        '''
+        objs = [self.get(cls, id) for id in ids]
+        return [obj for obj in objs if obj is not None]
+
+    def page(self, cls, limit, after=None, attr=None, value=None):
+        '''Returns at most limit objects of the given class in the order
+            of their IDs, starting after the ID after, and only the ones
+            whose attr equals value if attr is given. The objects are
+            found by bisecting keys kept in order, for any page
+        '''
+        name = class_name(cls)
+        if attr is not None and attr not in relations.get(name, ()):
+            objs = sorted(self.related(cls, attr, value),
+                          key=lambda obj: obj.id)
+            if after is not None:
+                objs = [obj for obj in objs if obj.id > after]
+            return objs[:limit]
+        with self.__mutex:
+            keys = self.__ordered(name, attr, value)
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right(keys, name + "." + after)
+            return [self.__fetch(key) for key in keys[start:start + limit]]
+
+    def count(self, cls=None, attr=None, value=None):
         '''Returns the number of objects in storage matching the given
-            class. If no class is passed, returns the count of all objects
-            in storage
+            class, and whose attr equals value if attr is given. If no
+            class is passed, returns the count of all objects in storage
         '''
-        return len(self.all(cls))
+        if attr is not None:
+            name = class_name(cls)
+            if attr not in relations.get(name, ()):
+                return len(self.related(cls, attr, value))
+            with self.__mutex:
+                self.__partitions()
+                index = self.__related.get((name, attr), {})
+                return len(index.get(value, {}))
+        with self.__mutex:
+            if cls is None:
+                if self.__lazy_owner is self.__objects:
+                    return len(self.__objects) + len(self.__lazy)
+                return len(self.__objects)
+            return len(self.__partitions().get(class_name(cls), {}))
+
+    def counts(self, clss=None):
+        '''Returns the number of objects of each of the given classes (all
+            of them by default) by class name
+        '''
+        if clss is None:
+            clss = classes.values()
+        with self.__mutex:
+            partitions = self.__partitions()
+            return {class_name(cls): len(partitions.get(class_name(cls), {}))
+                    for cls in clss}
 
     def delete(self, obj=None):
         """delete obj from __objects if it’s inside"""
         if obj is not None:
             key = obj.__class__.__name__ + '.' + obj.id
-            if key in self.__objects:
-                del self.__objects[key]
+            with self.__mutex:
+                if self.__stored(key):
+                    self.__drop(key)
+                    self.__dirty.add(key)
+
+    def related(self, cls, attr, value):
+        '''Returns the list of objects of the given class whose foreign
+            key attr equals value
+        '''
+        name = class_name(cls)
+        if attr not in relations.get(name, ()):
+            return [obj for obj in self.all(cls).values()
+                    if getattr(obj, attr, None) == value]
+        with self.__mutex:
+            self.__partitions()
+            keys = list(self.__related.get((name, attr), {}).get(value, {}))
+            return [obj for obj in map(self.__fetch, keys)
+                    if obj is not None]
+
+    def touch(self, obj, attr, old):
+        '''Records that attr of obj was changed from old: marks obj as
+            dirty and moves it between foreign key indexes
+        '''
+        if "id" not in obj.__dict__:
+            return
+        name = obj.__class__.__name__
+        key = name + "." + obj.id
+        with self.__mutex:
+            self.__partitions()
+            if self.__objects.get(key) is not obj:
+                return
+            self.__dirty.add(key)
+            if attr not in relations.get(name, ()):
+                return
+            index = self.__related.setdefault((name, attr), {})
+            index.get(old, {}).pop(key, None)
+            index.setdefault(getattr(obj, attr, None), {})[key] = None
+            self.__order_remove((name, attr, old), key)
+            self.__order_add((name, attr, getattr(obj, attr, None)), key)
+
+    def is_dirty(self, obj):
+        '''Tells whether obj was created, changed or deleted since it was
+            last saved
+        '''
+        key = obj.__class__.__name__ + "." + obj.id
+        with self.__mutex:
+            if key in self.__dirty or self.__objects.get(key) is not obj:
+                return True
+            record = self.__records.get(key)
+        # also catches changes that bypassed __setattr__
+        return record is None or record != obj.to_dict(False)
 
     def close(self):
-        """call reload() method for deserializing the JSON file to objects"""
-        self.reload()
+        """applies the changes other processes saved to the files since
+        they were last read or written, if any"""
+        if self.__changed():
+            with self.__lock, self.__locked(False):
+                self.__refresh()
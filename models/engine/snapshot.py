@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+"""
+Contains the binary snapshot format of FileStorage: the records stored one
+after the other, followed by an index of their offsets by key. The file is
+read through mmap, and a record is only decoded when it is accessed
+"""
+
+from collections.abc import Mapping
+import mmap
+from models.engine import codec
+import struct
+
+MAGIC = b"HBNBSNP1"
+# magic, offset and length of the index
+header = struct.Struct("<8sQQ")
+
+
+class Record(Mapping):
+    """a record of a snapshot, decoded the first time one of its
+    attributes is read, except for the attributes copied to the index"""
+    __slots__ = ("map", "offset", "length", "fields", "record")
+
+    def __init__(self, map, offset, length, fields):
+        self.map = map
+        self.offset = offset
+        self.length = length
+        self.fields = fields
+        self.record = None
+
+    def decoded(self):
+        """returns the record as a dictionary"""
+        if self.record is None:
+            self.record = codec.loads(self.raw())
+        return self.record
+
+    def raw(self):
+        """returns the encoded record"""
+        return self.map[self.offset:self.offset + self.length]
+
+    def get(self, key, default=None):
+        """returns the attribute key, without decoding the record if it
+        was copied to the index"""
+        if key in self.fields:
+            return self.fields[key]
+        return self.decoded().get(key, default)
+
+    def __getitem__(self, key):
+        return self.decoded()[key]
+
+    def __iter__(self):
+        return iter(self.decoded())
+
+    def __len__(self):
+        return len(self.decoded())
+
+
+def dump_records(records, f, fields=None):
+    """writes a {key: record} dictionary to the binary file f. The
+    attributes of a record listed in fields under its class name are
+    copied to the index"""
+    f.write(header.pack(MAGIC, 0, 0))
+    offset = header.size
+    index = []
+    for key, record in records.items():
+        if isinstance(record, Record):
+            data = record.raw()
+            attrs = record.fields
+        else:
+            data = codec.dumps(record).encode()
+            attrs = {attr: record[attr]
+                     for attr in (fields or {}).get(key.split(".", 1)[0], ())
+                     if attr in record}
+        f.write(data)
+        index.append([key, offset, len(data), attrs])
+        offset += len(data)
+    data = codec.dumps(index).encode()
+    f.write(data)
+    f.seek(0)
+    f.write(header.pack(MAGIC, offset, len(data)))
+    f.seek(0, 2)
+
+
+def is_snapshot(f):
+    """tells whether the binary file f holds a snapshot, leaving it at
+    its start"""
+    magic = f.read(len(MAGIC))
+    f.seek(0)
+    return magic == MAGIC
+
+
+def iter_records(f):
+    """yields the (key, record) pairs of the snapshot stored in the binary
+    file f. The records are decoded on first access, and remain readable
+    once f is closed as long as the file is replaced rather than rewritten
+    in place"""
+    map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, offset, length = header.unpack_from(map)
+    if magic != MAGIC or offset + length > len(map):
+        raise ValueError("not a snapshot, or truncated")
+    for key, start, size, attrs in codec.loads(map[offset:offset + length]):
+        yield key, Record(map, start, size, attrs)
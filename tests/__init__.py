@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""
+Contains the IsolatedTestCase and FileStorageTestCase classes, the bases
+of the test classes using the storage of models
+"""
+
+import inspect
+import models
+from models.engine.file_storage import FileStorage
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class IsolatedTestCase(unittest.TestCase):
+    """Runs each test in a transaction of the storage rolled back at its
+    end when the storage is a database, so that the schema is only
+    created once per run. Subclasses defining setUp call this one first,
+    and it calls the next one, e.g. the one of FileStorageTestCase"""
+    def setUp(self):
+        """Starts the transaction of the test"""
+        super().setUp()
+        if models.storage_t != "db":
+            return
+        isolated = models.storage.isolated()
+        isolated.__enter__()
+        self.addCleanup(isolated.__exit__, None, None, None)
+
+
+class FileStorageTestCase(unittest.TestCase):
+    """Points FileStorage to an empty file.json in a temporary directory
+    for each test, starting from empty objects, indexes, caches and
+    counters, then restores all the class state of FileStorage, its
+    settings included. As when __objects is replaced, the indexes are
+    built on first use and the first save writes a full snapshot.
+    Subclasses defining setUp call this one first"""
+    def setUp(self):
+        """Empties the storage, which self.storage uses, at self.path"""
+        self.saved = {name: value for name, value in vars(FileStorage).items()
+                      if name.startswith("_FileStorage__") and
+                      not inspect.isfunction(value)}
+        self.addCleanup(self.restore_storage)
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "file.json")
+        objects = {}
+        fresh = {"file_path": self.path, "objects": objects,
+                 "by_class": {}, "related": {}, "order": {}, "lazy": {},
+                 "lazy_owner": objects, "indexed": None, "size": 0,
+                 "dirty": set(), "records": {}, "rewrite": False,
+                 "shared": None, "generation": 0, "snapshots": 0,
+                 "compactor": None, "snapshot_stamp": None,
+                 "journal_stamp": None, "applied": 0, "saves": 0,
+                 "flushed": 0, "flushing": False, "flushes": 0,
+                 "coalesced": 0, "flusher": None, "attempts": 0,
+                 "flush_error": None}
+        for name, value in fresh.items():
+            setattr(FileStorage, "_FileStorage__" + name, value)
+        self.storage = FileStorage()
+
+    def restore_storage(self):
+        """Waits for the writes of the test, then restores the storage"""
+        compactor = FileStorage._FileStorage__compactor
+        if compactor is not None:
+            compactor.join()
+        self.storage.flush()
+        for name, value in self.saved.items():
+            setattr(FileStorage, name, value)
+        shutil.rmtree(self.tmp)
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Contains the TestStreamingDocs and TestStreaming classes
+"""
+
+from api.v1.app import app
+from api.v1.views import streaming
+import inspect
+import json
+import models
+from models.state import State
+import pep8
+from tests import FileStorageTestCase, IsolatedTestCase
+import unittest
+from unittest import mock
+
+
+class TestStreamingDocs(unittest.TestCase):
+    """Tests to check the documentation and style of streaming.py"""
+    @classmethod
+    def setUpClass(cls):
+        """Set up for the doc tests"""
+        cls.streaming_f = inspect.getmembers(streaming, inspect.isfunction)
+
+    def test_pep8_conformance_streaming(self):
+        """Test that api/v1/views/streaming.py conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['api/v1/views/streaming.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_pep8_conformance_test_streaming(self):
+        """Test that tests/test_api/test_v1/test_views/test_streaming.py
+        conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(
+            ['tests/test_api/test_v1/test_views/test_streaming.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_streaming_module_docstring(self):
+        """Test for the streaming.py module docstring"""
+        self.assertIsNot(streaming.__doc__, None,
+                         "streaming.py needs a docstring")
+        self.assertTrue(len(streaming.__doc__) >= 1,
+                        "streaming.py needs a docstring")
+
+    def test_streaming_func_docstrings(self):
+        """Test for the presence of docstrings in streaming functions"""
+        for func in self.streaming_f:
+            self.assertIsNot(func[1].__doc__, None,
+                             "{:s} function needs a docstring".format(func[0]))
+            self.assertTrue(len(func[1].__doc__) >= 1,
+                            "{:s} function needs a docstring".format(func[0]))
+
+
+class TestStreaming(IsolatedTestCase, FileStorageTestCase):
+    """Test the lists of more than HBNB_API_STREAM_THRESHOLD objects sent
+    by the API, in chunks of 1024 characters"""
+    def setUp(self):
+        """Stores more states than the threshold"""
+        super().setUp()
+        for i in range(streaming.stream_threshold + 50):
+            models.storage.new(State(name="State {:d}".format(i)))
+        models.storage.save()
+        patcher = mock.patch.object(streaming, "chunk_size", 1024)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_full_read(self):
+        """Test that the streamed list holds the bytes jsonify sends, and
+        that the storage is closed once it is read"""
+        with mock.patch.object(models.storage, "close") as close:
+            response = self.client.get("/api/v1/states")
+            self.assertNotIn("Content-Length", response.headers)
+            self.assertEqual(response.mimetype, "application/json")
+            chunks = iter(response.response)
+            body = next(chunks)
+            self.assertEqual(close.call_count, 0)
+            body += b"".join(chunks)
+            self.assertEqual(close.call_count, 1)
+            response.close()
+            self.assertEqual(close.call_count, 1)
+        threshold = streaming.stream_threshold + 50
+        self.assertEqual(len(json.loads(body)), threshold)
+        with mock.patch.object(streaming, "stream_threshold", threshold):
+            expected = self.client.get("/api/v1/states")
+        self.assertIn("Content-Length", expected.headers)
+        self.assertEqual(body, expected.get_data())
+
+    def test_early_close(self):
+        """Test that the storage is closed when the client stops reading"""
+        with mock.patch.object(models.storage, "close") as close:
+            response = self.client.get("/api/v1/states")
+            self.assertNotIn("Content-Length", response.headers)
+            chunks = iter(response.response)
+            self.assertTrue(next(chunks).startswith(b"[{"))
+            self.assertEqual(close.call_count, 0)
+            response.close()
+            self.assertEqual(close.call_count, 1)
+
+    def test_under_threshold(self):
+        """Test that a list of at most the threshold objects is not
+        streamed, and that the storage is closed with the request"""
+        threshold = streaming.stream_threshold + 50
+        with mock.patch.object(streaming, "stream_threshold", threshold), \
+                mock.patch.object(models.storage, "close") as close:
+            response = self.client.get("/api/v1/states")
+            self.assertEqual(close.call_count, 1)
+        self.assertEqual(response.headers["Content-Length"],
+                         str(len(response.get_data())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"""
+Contains the TestCacheDocs and TestCache classes
+"""
+
+from datetime import datetime
+import inspect
+from models.engine import cache
+import os
+import pep8
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+class TestCacheDocs(unittest.TestCase):
+    """Tests to check the documentation and style of the cache module"""
+    def test_pep8_conformance_cache(self):
+        """Test that models/engine/cache.py conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['models/engine/cache.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_pep8_conformance_test_cache(self):
+        """Test tests/test_models/test_engine/test_cache.py conforms to
+        PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['tests/test_models/test_engine/\
+test_cache.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_cache_module_docstring(self):
+        """Test for the cache.py module docstring"""
+        self.assertIsNot(cache.__doc__, None,
+                         "cache.py needs a docstring")
+        self.assertTrue(len(cache.__doc__) >= 1,
+                        "cache.py needs a docstring")
+
+    def test_cache_class_docstrings(self):
+        """Test for the presence of docstrings in cache classes and their
+        methods"""
+        for name, cls in inspect.getmembers(cache, inspect.isclass):
+            if cls.__module__ != cache.__name__:
+                continue
+            self.assertTrue(cls.__doc__,
+                            "{:s} class needs a docstring".format(name))
+            for func in inspect.getmembers(cls, inspect.isfunction):
+                if func[0] != "__init__":
+                    self.assertTrue(func[1].__doc__,
+                                    "{:s} method needs a docstring".format(
+                                        func[0]))
+
+
+class TestCache(unittest.TestCase):
+    """Test the backends and the single-flight loader of the cache
+    module"""
+    def setUp(self):
+        """Creates a directory for the directory backend"""
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Removes the directory of the directory backend"""
+        shutil.rmtree(self.tmp)
+
+    def backends(self, size=3, ttl=30.0):
+        """Returns a backend of each kind"""
+        return [cache.MemoryCache(size, ttl),
+                cache.DirectoryCache(self.tmp, size, ttl)]
+
+    def test_get_and_set(self):
+        """Test that values, None included, are read back"""
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                self.assertIs(backend.get("a"), cache.MISSING)
+                values = [{"id": "1", "price": 1.5,
+                           "created_at": datetime(2017, 3, 25, 2, 17, 6)}]
+                backend.set("a", values)
+                backend.set("b", None)
+                self.assertEqual(backend.get("a"), values)
+                self.assertIsNone(backend.get("b"))
+
+    @unittest.skipIf(not hasattr(os, "getuid"), "no file owners")
+    def test_directory_private(self):
+        """Test that the directory backend refuses a directory other
+        users can write to"""
+        os.chmod(self.tmp, 0o777)
+        with self.assertRaises(PermissionError):
+            cache.DirectoryCache(self.tmp)
+        os.chmod(self.tmp, 0o700)
+        cache.DirectoryCache(self.tmp)
+        path = os.path.join(self.tmp, "new")
+        cache.DirectoryCache(path)
+        self.assertEqual(os.stat(path).st_mode & 0o077, 0)
+
+    def test_ttl(self):
+        """Test that values expire after ttl seconds"""
+        for backend in self.backends(ttl=0.05):
+            with self.subTest(backend=type(backend).__name__):
+                backend.set("a", 1)
+                self.assertEqual(backend.get("a"), 1)
+                time.sleep(0.1)
+                self.assertIs(backend.get("a"), cache.MISSING)
+
+    def test_lru(self):
+        """Test that the least recently used value is evicted first"""
+        backend = cache.MemoryCache(size=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIs(backend.get("b"), cache.MISSING)
+        self.assertEqual(backend.get("c"), 3)
+
+    def test_directory_evicts(self):
+        """Test that the directory backend keeps about size values"""
+        backend = cache.DirectoryCache(self.tmp, size=10)
+        for i in range(100):
+            backend.set(str(i), i)
+        self.assertLessEqual(
+            sum(backend.get(str(i)) is not cache.MISSING
+                for i in range(100)), 10)
+        self.assertEqual(backend.get("99"), 99)
+
+    def test_counters(self):
+        """Test that counters are shared by the backends of a
+        directory"""
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual(backend.counter("a"), 0)
+                self.assertEqual(backend.incr("a"), 1)
+                self.assertEqual(backend.incr("a"), 2)
+                self.assertEqual(backend.counter("a"), 2)
+        other = cache.DirectoryCache(self.tmp)
+        self.assertEqual(other.counter("a"), 2)
+
+    def test_single_flight(self):
+        """Test that concurrent misses of a key load it once"""
+        query = cache.QueryCache(cache.MemoryCache())
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def load():
+            started.set()
+            release.wait(10)
+            return "value"
+
+        def fetch():
+            results.append(query.fetch("a", load))
+        threads = [threading.Thread(target=fetch) for i in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(10))
+        for thread in threads[1:]:
+            thread.start()
+        while query.stats()["misses"] < 5:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(query.stats(), {"hits": 0, "misses": 5,
+                                         "loads": 1})
+        self.assertEqual(query.fetch("a", load), "value")
+        self.assertEqual(query.stats()["hits"], 1)
+
+    def test_failed_load(self):
+        """Test that a failed load is not cached"""
+        query = cache.QueryCache(cache.MemoryCache())
+        load = mock.Mock(side_effect=[ValueError, "value"])
+        with self.assertRaises(ValueError):
+            query.fetch("a", load)
+        self.assertEqual(query.fetch("a", load), "value")
+        self.assertEqual(query.fetch("a", load), "value")
+        self.assertEqual(load.call_count, 2)
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""
+Contains the TestCodecDocs and TestCodec classes
+"""
+
+import inspect
+import io
+import json
+from models.engine import codec
+import pep8
+import unittest
+from unittest import mock
+
+records = {"State.1": {"id": "1", "name": "Ohio", "__class__": "State"},
+           "Place.2": {"id": "2", "amenity_ids": ["a", "b"],
+                       "latitude": 37.5, "name": "Big \"loft\", {nice}",
+                       "__class__": "Place"},
+           "Review.3": None}
+
+
+class Reader(io.StringIO):
+    """Text file recording the number of characters of each read"""
+    def __init__(self, text):
+        """Holds text"""
+        super().__init__(text)
+        self.sizes = []
+
+    def read(self, size=-1):
+        """Reads at most size characters"""
+        data = super().read(size)
+        self.sizes.append(len(data))
+        return data
+
+    def readline(self, size=-1):
+        """Reads a line of at most size characters"""
+        line = super().readline(size)
+        self.sizes.append(len(line))
+        return line
+
+
+class TestCodecDocs(unittest.TestCase):
+    """Tests to check the documentation and style of the codec module"""
+    def test_pep8_conformance_codec(self):
+        """Test that models/engine/codec.py conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['models/engine/codec.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_pep8_conformance_test_codec(self):
+        """Test tests/test_models/test_engine/test_codec.py conforms to
+        PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['tests/test_models/test_engine/\
+test_codec.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_codec_module_docstring(self):
+        """Test for the codec.py module docstring"""
+        self.assertIsNot(codec.__doc__, None,
+                         "codec.py needs a docstring")
+        self.assertTrue(len(codec.__doc__) >= 1,
+                        "codec.py needs a docstring")
+
+    def test_codec_func_docstrings(self):
+        """Test for the presence of docstrings in codec functions"""
+        for func in inspect.getmembers(codec, inspect.isfunction):
+            self.assertIsNot(func[1].__doc__, None,
+                             "{:s} function needs a docstring".format(func[0]))
+            self.assertTrue(len(func[1].__doc__) >= 1,
+                            "{:s} function needs a docstring".format(func[0]))
+
+
+class TestCodec(unittest.TestCase):
+    """Test the streaming reader and writer of the codec module"""
+    def read(self, text, chunk_size=1 << 16):
+        """Returns the records read back from text, with and without
+        orjson"""
+        result = dict(codec.iter_records(io.StringIO(text), chunk_size))
+        with mock.patch.object(codec, "orjson", None):
+            self.assertEqual(
+                dict(codec.iter_records(io.StringIO(text), chunk_size)),
+                result)
+        return result
+
+    def test_dump_records_is_json(self):
+        """Test that dump_records writes a JSON object, one member per
+        line"""
+        f = io.StringIO()
+        codec.dump_records(records, f)
+        self.assertEqual(json.loads(f.getvalue()), records)
+        self.assertEqual(len(f.getvalue().splitlines()), len(records) + 2)
+        self.assertEqual(self.read(f.getvalue()), records)
+
+    def test_single_line_file(self):
+        """Test that files written by json.dump are read in small
+        chunks"""
+        text = json.dumps(records)
+        for chunk_size in [1, 7, 64, 1 << 16]:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.read(text, chunk_size), records)
+
+    def test_single_line_file_bounded(self):
+        """Test that reading a file written by json.dump never reads much
+        more than a chunk at once"""
+        many = {"State.{:d}".format(i): records["State.1"]
+                for i in range(1000)}
+        f = Reader(json.dumps(many))
+        self.assertEqual(dict(codec.iter_records(f, 256)), many)
+        self.assertLessEqual(max(f.sizes), 256)
+
+    def test_indented_file(self):
+        """Test that members spanning several lines are read"""
+        text = json.dumps(records, indent=4)
+        self.assertEqual(self.read(text), records)
+        self.assertEqual(self.read(text.replace("\n", " ")), records)
+
+    def test_empty_object(self):
+        """Test that an empty object yields nothing"""
+        self.assertEqual(self.read("{}"), {})
+        self.assertEqual(self.read("{\n}\n"), {})
+
+    def test_truncated_file(self):
+        """Test that a truncated file raises ValueError"""
+        for text in [json.dumps(records)[:-5], '{"a": 1,', "{\n\"a\": {",
+                     "", "[1, 2]"]:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    self.read(text, 4)
@@ -17,7 +17,13 @@ from models.user import User
 import json
 import os
 import pep8
+import shutil
+import sqlalchemy
+import tempfile
+from tests import IsolatedTestCase
+import time
 import unittest
+from unittest import mock
 DBStorage = db_storage.DBStorage
 classes = {"Amenity": Amenity, "City": City, "Place": Place,
            "Review": Review, "State": State, "User": User}
@@ -68,7 +74,7 @@ test_db_storage.py'])
                             "{:s} method needs a docstring".format(func[0]))
 
 
-class TestFileStorage(unittest.TestCase):
+class TestFileStorage(IsolatedTestCase):
     """Test the FileStorage class"""
     @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
     def test_all_returns_dict(self):
@@ -88,7 +94,7 @@ class TestFileStorage(unittest.TestCase):
         """Test that save properly saves objects to file.json"""
 
 
-class TestDBStorageCount(unittest.TestCase):
+class TestDBStorageCount(IsolatedTestCase):
     '''Tests the number of base object instance in DBStorage
     '''
     def test_all_object_count(self):
@@ -113,7 +119,7 @@ class TestDBStorageCount(unittest.TestCase):
         self.assertEqual(models.storage.get(User, new_user.id), new_user)
 
 
-class TestDBStorageGetMethod(unittest.TestCase):
+class TestDBStorageGetMethod(IsolatedTestCase):
     '''Test the get method of the DBStorage class
     '''
     @unittest.skipIf(models.storage != 'db', "not testing db storage")
@@ -137,3 +143,567 @@ class TestDBStorageGetMethod(unittest.TestCase):
         '''
         new_state = State('Florida')
         new_state.save()
+
+
+class TestIsolatedTestCase(unittest.TestCase):
+    '''Tests the rollback of the tests based on IsolatedTestCase
+    '''
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_rolls_back(self):
+        '''Test that a test run by unittest leaves no object behind'''
+        class Saves(IsolatedTestCase):
+            def test_save(self):
+                State(name="Rolled back").save()
+                self.assertTrue(models.storage.all(State))
+        before = models.storage.count(State)
+        result = unittest.TestResult()
+        Saves("test_save").run(result)
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(result.testsRun, 1)
+        models.storage.close()
+        self.assertEqual(models.storage.count(State), before)
+
+
+class TestDBStorageURL(unittest.TestCase):
+    '''Tests DBStorage with a database URL
+    '''
+    def setUp(self):
+        '''Creates a directory for SQLite databases'''
+        self.tmp = tempfile.mkdtemp()
+        self.url = "sqlite:///" + os.path.join(self.tmp, "hbnb.db")
+
+    def tearDown(self):
+        '''Removes the SQLite databases'''
+        shutil.rmtree(self.tmp)
+
+    def storage(self, **env):
+        '''Returns a reloaded DBStorage using the SQLite database, without
+        reference tier unless asked for'''
+        env["HBNB_DB_URL"] = self.url
+        env.setdefault("HBNB_ENV", "dev")
+        env.setdefault("HBNB_DB_REFERENCE_TTL", "0")
+        with mock.patch.dict(os.environ, env):
+            storage = DBStorage()
+        storage.reload()
+        self.addCleanup(storage.close)
+        return storage
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_sqlite_pragmas(self):
+        '''Test that SQLite connections use WAL and foreign keys'''
+        engine = self.storage()._DBStorage__engine
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql(
+                "PRAGMA journal_mode").scalar(), "wal")
+            self.assertEqual(connection.exec_driver_sql(
+                "PRAGMA foreign_keys").scalar(), 1)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_test_env_drops_tables(self):
+        '''Test that HBNB_ENV=test starts from empty tables, once per
+        process'''
+        storage = self.storage()
+        storage.new(State(name="Nevada"))
+        storage.save()
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(self.storage().count(State), 1)
+        with mock.patch.object(db_storage, "schemas", set()):
+            storage = self.storage(HBNB_ENV="test")
+            self.assertEqual(storage.count(State), 0)
+            storage.new(State(name="Nevada"))
+            storage.save()
+            self.assertEqual(self.storage(HBNB_ENV="test").count(State), 1)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_isolated(self):
+        '''Test that the changes committed in isolated are rolled back'''
+        storage = self.storage()
+        storage.new(State(name="Nevada"))
+        storage.save()
+        with storage.isolated():
+            state = State(name="Utah")
+            storage.new(state)
+            storage.save()
+            storage.close()
+            self.assertEqual(storage.count(State), 2)
+            storage.delete(storage.get(State, state.id))
+            storage.save()
+            self.assertEqual(storage.count(State), 1)
+            storage.new(State(name="Idaho"))
+            storage.save()
+        self.assertEqual(storage.count(State), 1)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_pool_stats(self):
+        '''Test that the pool statistics follow the connections'''
+        storage = self.storage(HBNB_DB_POOL_SIZE="3")
+        storage.count(State)
+        stats = storage.pool_stats()
+        self.assertEqual(stats["pool"], "TimedQueuePool")
+        self.assertEqual(stats["size"], 3)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["checked_out"], 1)
+        self.assertGreaterEqual(stats["checkouts"], 1)
+        storage.close()
+        self.assertEqual(storage.pool_stats()["checked_out"], 0)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_iterate(self):
+        '''Test that iterate yields every object, in chunks'''
+        storage = self.storage()
+        for i in range(5):
+            storage.new(State(name=str(i)))
+        storage.new(Amenity(name="Wifi"))
+        storage.save()
+        storage.close()
+        options = db_storage.Select.execution_options
+        with mock.patch.object(db_storage.Select, "execution_options",
+                               autospec=True, side_effect=options) as patch:
+            names = [obj.name for obj in storage.iterate(State, 2)]
+        self.assertEqual(sorted(names), [str(i) for i in range(5)])
+        self.assertEqual(patch.call_args.kwargs, {"yield_per": 2})
+        self.assertEqual(len(list(storage.iterate())), 6)
+        self.assertEqual(list(storage.iterate("Amenity"))[0].name, "Wifi")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_page(self):
+        '''Test that page walks the objects in the order of their ids'''
+        storage = self.storage()
+        state = State(name="Oregon")
+        storage.new(state)
+        for i in range(5):
+            storage.new(City(name=str(i), state_id=state.id))
+        storage.new(State(name="Idaho"))
+        storage.save()
+        ids, after = [], None
+        while True:
+            page = storage.page(City, 2, after, "state_id", state.id)
+            if not page:
+                break
+            ids.extend(city.id for city in page)
+            after = page[-1].id
+        self.assertEqual(ids, sorted(city.id for city in state.cities))
+        self.assertEqual(storage.count(City, "state_id", state.id), 5)
+        self.assertEqual(storage.count(City, "state_id", "other"), 0)
+        self.assertEqual([obj.id for obj in storage.page("State", 5)],
+                         sorted(obj.id for obj in
+                                storage.all(State).values()))
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_save_after_autoflush(self):
+        '''Test that save commits a change a query already flushed'''
+        storage = self.storage()
+        state = State(name="Old")
+        storage.new(state)
+        storage.save()
+        storage.close()
+        state = storage.get(State, state.id)
+        state.name = "New"
+        storage.all(State)
+        self.assertTrue(storage.is_dirty(state))
+        with mock.patch.object(models, "storage", storage):
+            state.save()
+        storage.close()
+        self.assertEqual(storage.get(State, state.id).name, "New")
+        self.assertFalse(storage.is_dirty(storage.get(State, state.id)))
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_migrate(self):
+        '''Test that migrate adds the missing indexes only'''
+        storage = self.storage()
+        storage.new(State(name="Nevada"))
+        storage.save()
+        self.assertEqual(storage.migrate(), [])
+        engine = storage._DBStorage__engine
+        with engine.begin() as connection:
+            connection.exec_driver_sql("DROP INDEX ix_cities_state_id")
+            connection.exec_driver_sql("DROP INDEX ix_places_max_guest")
+            connection.exec_driver_sql(
+                "CREATE INDEX fk_places_user ON places (user_id, name)")
+            connection.exec_driver_sql("DROP INDEX ix_places_user_id")
+        self.assertEqual(storage.migrate(),
+                         ["ix_cities_state_id", "ix_places_max_guest"])
+        self.assertEqual(storage.migrate(), [])
+        self.assertEqual(storage.count(State), 1)
+        indexes = sqlalchemy.inspect(engine).get_indexes("places")
+        self.assertIn(["latitude", "longitude"],
+                      [index["column_names"] for index in indexes])
+
+
+class TestDBStorageReplicas(unittest.TestCase):
+    '''Tests the routing of reads to a read replica, which the tests do
+        not replicate to so as to tell where a read went
+    '''
+    def setUp(self):
+        '''Creates a replica holding a state of its own'''
+        TestDBStorageURL.setUp(self)
+        self.replica = "sqlite:///" + os.path.join(self.tmp, "replica.db")
+        with mock.patch.dict(os.environ, {"HBNB_DB_URL": self.replica}):
+            replica = DBStorage()
+        replica.reload()
+        replica.new(State(name="Replica"))
+        replica.save()
+        replica.close()
+
+    tearDown = TestDBStorageURL.tearDown
+    storage = TestDBStorageURL.storage
+
+    def names(self, storage, client=None, write=False):
+        '''Returns the names of the states read by a new session'''
+        storage.close()
+        storage.route(client, write)
+        return [state.name for state in storage.all(State).values()]
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_reads_go_to_replica(self):
+        '''Test that reads go to the replica, and writes do not'''
+        storage = self.storage(HBNB_DB_READ_URLS=self.replica,
+                               HBNB_DB_STICKY_SECONDS="0")
+        self.assertEqual(self.names(storage), ["Replica"])
+        self.assertEqual(self.names(storage, write=True), [])
+        storage.new(State(name="Primary"))
+        storage.save()
+        self.assertEqual(self.names(storage), ["Replica"])
+        self.assertEqual(storage.get(State, "missing"), None)
+        self.assertEqual(self.names(storage, write=True), ["Primary"])
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_read_your_writes(self):
+        '''Test that a session and its client read from the primary
+            database after writing'''
+        storage = self.storage(HBNB_DB_READ_URLS=self.replica)
+        storage.route("a")
+        storage.new(State(name="Primary"))
+        self.assertEqual([state.name for state in
+                          storage.all(State).values()], ["Primary"])
+        storage.save()
+        self.assertEqual(self.names(storage, "a"), ["Primary"])
+        self.assertEqual(self.names(storage, "b"), ["Replica"])
+        with mock.patch.object(db_storage.time, "monotonic",
+                               return_value=time.monotonic() + 5):
+            self.assertEqual(self.names(storage, "a"), ["Replica"])
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_no_replica(self):
+        '''Test that reads go to the primary database without replica'''
+        storage = self.storage()
+        self.assertEqual(self.names(storage), [])
+
+
+class TestDBStorageReference(unittest.TestCase):
+    '''Tests the in-memory copy of the states, cities and amenities
+    '''
+    setUp = TestDBStorageURL.setUp
+    tearDown = TestDBStorageURL.tearDown
+    storage = TestDBStorageURL.storage
+
+    def executed(self, conn, cursor, statement, *args):
+        '''Records a statement, except for the BEGIN of SQLite and the
+        savepoints of the test transaction'''
+        if statement != "BEGIN" and not statement.startswith(
+                ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO")):
+            self.statements.append(statement)
+
+    def reference_storage(self):
+        '''Returns a storage keeping the reference objects in memory,
+        holding a state with two cities and an amenity'''
+        storage = self.storage(HBNB_DB_REFERENCE_TTL="60")
+        self.state = State(name="Oregon")
+        storage.new(self.state)
+        for name in ["Salem", "Bend"]:
+            storage.new(City(name=name, state_id=self.state.id))
+        self.amenity = Amenity(name="Wifi")
+        storage.new(self.amenity)
+        storage.save()
+        storage.close()
+        self.statements = []
+        engine = storage._DBStorage__engine
+        sqlalchemy.event.listen(engine, "before_cursor_execute",
+                                self.executed)
+        self.addCleanup(sqlalchemy.event.remove, engine,
+                        "before_cursor_execute", self.executed)
+        return storage
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_reads_without_query(self):
+        '''Test that the reference objects are read once'''
+        storage = self.reference_storage()
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(len(self.statements), 3)
+        for i in range(2):
+            storage.close()
+            state = storage.get(State, self.state.id)
+            self.assertEqual(sorted(city.name for city in state.cities),
+                             ["Bend", "Salem"])
+            self.assertIs(state.cities[0].state, state)
+            self.assertEqual(storage.all(City, load=["state"]),
+                             {"City." + city.id: city
+                              for city in state.cities})
+            self.assertEqual(storage.get_many(Amenity, [self.amenity.id]),
+                             [storage.get("Amenity", self.amenity.id)])
+            self.assertEqual(storage.counts([State, City, Amenity]),
+                             {"State": 1, "City": 2, "Amenity": 1})
+        self.assertEqual(len(self.statements), 3)
+        storage.get_many(State, [self.state.id], load=["cities.places"])
+        self.assertEqual(len(self.statements), 6)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_commit_refreshes(self):
+        '''Test that committing a change to a reference object drops the
+        copies, and that pending changes are read back'''
+        storage = self.reference_storage()
+        state = storage.get(State, self.state.id)
+        state.name = "Idaho"
+        self.assertEqual(storage.get(State, self.state.id).name, "Idaho")
+        self.assertEqual(storage.all(State)["State." + state.id].name,
+                         "Idaho")
+        storage.save()
+        storage.close()
+        self.assertEqual(storage.get(State, self.state.id).name, "Idaho")
+        storage.new(State(name="Utah"))
+        storage.save()
+        storage.close()
+        self.assertEqual(storage.count(State), 2)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_ttl_refreshes(self):
+        '''Test that the copies are reloaded after HBNB_DB_REFERENCE_TTL
+        seconds, picking up the changes of other processes'''
+        storage = self.reference_storage()
+        other = self.storage()
+        self.assertEqual(storage.count(Amenity), 1)
+        other.new(Amenity(name="Pool"))
+        other.save()
+        self.assertEqual(storage.count(Amenity), 1)
+        with mock.patch.object(db_storage.time, "monotonic",
+                               return_value=time.monotonic() + 60):
+            self.assertEqual(storage.count(Amenity), 2)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_miss_reads_database(self):
+        '''Test that get and get_many read an id missing from the copies
+        from the database, which reloads the copies'''
+        storage = self.reference_storage()
+        other = self.storage()
+        self.assertEqual(storage.count(State), 1)
+        state = State(name="Utah")
+        other.new(state)
+        other.save()
+        self.assertIsNone(storage.get(State, "missing"))
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(storage.get(State, state.id).name, "Utah")
+        self.assertEqual(
+            [obj.name for obj in storage.get_many(
+                State, [state.id, self.state.id], load=["cities"])],
+            ["Utah", "Oregon"])
+        self.assertEqual(storage.count(State), 2)
+
+
+class TestDBStorageCache(unittest.TestCase):
+    '''Tests the query cache of DBStorage
+    '''
+    setUp = TestDBStorageURL.setUp
+    tearDown = TestDBStorageURL.tearDown
+    storage = TestDBStorageURL.storage
+    executed = TestDBStorageReference.executed
+
+    def cached_storage(self, **env):
+        '''Returns a storage caching query results, holding a user'''
+        env.setdefault("HBNB_CACHE", "memory")
+        storage = self.storage(**env)
+        self.user = User(email="a@b.c", password="pwd")
+        storage.new(self.user)
+        storage.save()
+        storage.close()
+        self.statements = []
+        engine = storage._DBStorage__engine
+        sqlalchemy.event.listen(engine, "before_cursor_execute",
+                                self.executed)
+        self.addCleanup(sqlalchemy.event.remove, engine,
+                        "before_cursor_execute", self.executed)
+        return storage
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_hits_without_query(self):
+        '''Test that cached results are read without a query'''
+        storage = self.cached_storage()
+        for i in range(2):
+            storage.close()
+            user = storage.get(User, self.user.id)
+            self.assertEqual(user.email, "a@b.c")
+            self.assertEqual(user.password, self.user.password)
+            self.assertEqual(storage.all(User), {"User." + user.id: user})
+            storage.close()
+            self.assertEqual([obj.password for obj in
+                              storage.all(User).values()],
+                             [self.user.password])
+            self.assertEqual(storage.count(User), 1)
+        self.assertEqual(len(self.statements), 3)
+        self.assertEqual(storage.cache_stats()["hits"], 5)
+        user = storage.get(User, self.user.id)
+        self.assertEqual(user.places, [])
+        self.assertEqual(len(self.statements), 4)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_misses_not_cached(self):
+        '''Test that get does not cache an object not found, which
+        another process may create'''
+        storage = self.cached_storage()
+        other = self.storage()
+        self.assertIsNone(storage.get(User, "missing"))
+        other.new(User(id="missing", email="d@e.f", password="pwd"))
+        other.save()
+        storage.close()
+        self.assertEqual(storage.get(User, "missing").email, "d@e.f")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_off_by_default(self):
+        '''Test that the cache is off unless HBNB_CACHE is set'''
+        with mock.patch.dict(os.environ):
+            os.environ.pop("HBNB_CACHE", None)
+            self.assertIsNone(db_storage.query_cache())
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_commit_invalidates(self):
+        '''Test that commits invalidate the results of the classes they
+        change, and that pending changes are read back'''
+        storage = self.cached_storage()
+        self.assertEqual(storage.count(User), 1)
+        storage.new(User(email="d@e.f", password="pwd"))
+        self.assertEqual(storage.count(User), 2)
+        storage.save()
+        storage.close()
+        self.assertEqual(storage.count(User), 2)
+        user = storage.get(User, self.user.id)
+        user.first_name = "Ada"
+        storage.save()
+        storage.close()
+        self.assertEqual(storage.get(User, self.user.id).first_name, "Ada")
+        self.assertEqual(
+            storage.all(User)["User." + self.user.id].first_name, "Ada")
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_directory_backend(self):
+        '''Test that storages sharing a cache directory see each other's
+        commits'''
+        env = {"HBNB_CACHE": "directory",
+               "HBNB_CACHE_DIR": os.path.join(self.tmp, "cache")}
+        storage = self.cached_storage(**env)
+        other = self.storage(**env)
+        self.assertEqual(storage.count(User), 1)
+        self.assertEqual(other.count(User), 1)
+        self.assertEqual(len(self.statements), 1)
+        other.new(User(email="d@e.f", password="pwd"))
+        other.save()
+        storage.close()
+        self.assertEqual(storage.count(User), 2)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_off(self):
+        '''Test that HBNB_CACHE=none turns the cache off'''
+        storage = self.cached_storage(HBNB_CACHE="none")
+        self.assertIsNone(storage.cache_stats())
+        storage.count(User)
+        storage.count(User)
+        self.assertEqual(len(self.statements), 2)
+
+
+class TestDBStoragePoolOptions(unittest.TestCase):
+    '''Tests the pool options read from the environment
+    '''
+    def test_defaults(self):
+        '''Test that the pool defaults of SQLAlchemy are kept'''
+        with mock.patch.dict(os.environ):
+            for var in list(os.environ):
+                if var.startswith("HBNB_DB_"):
+                    del os.environ[var]
+            self.assertEqual(
+                db_storage.pool_options(db_storage.TimedQueuePool), {})
+
+    def test_options(self):
+        '''Test that the pool options are read'''
+        env = {"HBNB_DB_POOL_SIZE": "20", "HBNB_DB_MAX_OVERFLOW": "5",
+               "HBNB_DB_POOL_TIMEOUT": "2.5", "HBNB_DB_POOL_RECYCLE": "3600",
+               "HBNB_DB_POOL_PRE_PING": "1"}
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(
+                db_storage.pool_options(db_storage.TimedQueuePool),
+                {"pool_size": 20, "max_overflow": 5, "pool_timeout": 2.5,
+                 "pool_recycle": 3600, "pool_pre_ping": True})
+            self.assertEqual(
+                db_storage.pool_options(db_storage.StaticPool),
+                {"pool_recycle": 3600, "pool_pre_ping": True})
+
+
+class TestDBStorageQueries(IsolatedTestCase):
+    '''Tests the queries DBStorage sends to the database
+    '''
+    def setUp(self):
+        '''Counts the statements executed, reading every class from the
+        database'''
+        super().setUp()
+        patch = mock.patch.object(models.storage, "_DBStorage__tier_ttl", 0)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.statements = []
+        self.engine = models.storage._DBStorage__engine
+        sqlalchemy.event.listen(self.engine, "before_cursor_execute",
+                                self.executed)
+
+    def tearDown(self):
+        '''Stops counting the statements executed'''
+        sqlalchemy.event.remove(self.engine, "before_cursor_execute",
+                                self.executed)
+
+    def executed(self, conn, cursor, statement, *args):
+        '''Records a statement, except for the BEGIN of SQLite and the
+        savepoints of the test transaction'''
+        if statement != "BEGIN" and not statement.startswith(
+                ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO")):
+            self.statements.append(statement)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_get_uses_identity_map(self):
+        '''Test that get finds a loaded object without a query'''
+        state = State(name="Oregon")
+        state.save()
+        del self.statements[:]
+        self.assertIs(models.storage.get(State, state.id), state)
+        self.assertIs(models.storage.get("State", state.id), state)
+        self.assertEqual(self.statements, [])
+        self.assertIsNone(models.storage.get(State, "missing"))
+        self.assertEqual(len(self.statements), 1)
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_counts_in_one_query(self):
+        '''Test that counts counts every class in one query'''
+        State(name="Oregon").save()
+        before = models.storage.count(State)
+        del self.statements[:]
+        counts = models.storage.counts()
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(sorted(counts), sorted(classes))
+        self.assertEqual(counts["State"], before)
+        self.assertEqual(sum(counts.values()), models.storage.count())
+
+    @unittest.skipIf(models.storage_t != 'db', "not testing db storage")
+    def test_load_relationships(self):
+        '''Test that get_many loads the relationships asked for in a
+            constant number of queries
+        '''
+        states = [State(name="Oregon"), State(name="Idaho")]
+        for state in states:
+            models.storage.new(state)
+            for name in ["Salem", "Bend", "Boise"]:
+                models.storage.new(City(name=name, state_id=state.id))
+        models.storage.save()
+        models.storage.close()
+        del self.statements[:]
+        found = models.storage.get_many(State, [states[1].id, "missing",
+                                                states[0].id],
+                                        load=["cities"])
+        self.assertEqual([state.id for state in found],
+                         [states[1].id, states[0].id])
+        self.assertEqual([len(state.cities) for state in found], [3, 3])
+        self.assertEqual(len(self.statements), 2)
+        self.assertNotIn("cities", found[0].to_dict())
@@ -7,6 +7,7 @@ from datetime import datetime
 import inspect
 import models
 from models.engine import file_storage
+from models.engine import snapshot
 from models.amenity import Amenity
 from models.base_model import BaseModel
 from models.city import City
@@ -17,7 +18,15 @@ from models.user import User
 import json
 import os
 import pep8
+import shutil
+import subprocess
+import sys
+import tempfile
+from tests import FileStorageTestCase, IsolatedTestCase
+import threading
+import time
 import unittest
+from unittest import mock
 FileStorage = file_storage.FileStorage
 classes = {"Amenity": Amenity, "BaseModel": BaseModel, "City": City,
            "Place": Place, "Review": Review, "State": State, "User": User}
@@ -115,7 +124,7 @@ class TestFileStorage(unittest.TestCase):
         self.assertEqual(json.loads(string), json.loads(js))
 
 
-class TestFileStorageCount(unittest.TestCase):
+class TestFileStorageCount(IsolatedTestCase):
     '''Tests the count method on the FileStorage class
     '''
     def test_all_objects_count(self):
@@ -137,6 +146,120 @@ class TestFileStorageCount(unittest.TestCase):
         new_state.save()
         self.assertEqual(models.storage.count(State), obj_count + 1)
 
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_count_matches_all_by_class(self):
+        '''Tests that the per-class count agrees with all(cls) and
+            follows deletions
+        '''
+        new_city = City(name="Juneau")
+        new_city.save()
+        for cls in [City, "City"]:
+            self.assertEqual(models.storage.count(cls),
+                             len(models.storage.all(cls)))
+        obj_count = models.storage.count(City)
+        models.storage.delete(new_city)
+        self.assertEqual(models.storage.count(City), obj_count - 1)
+
+
+class TestFileStorageGetMany(unittest.TestCase):
+    '''Tests the get_many method on the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_get_many(self):
+        '''Tests that get_many returns the objects found, in order'''
+        states = [State(name="Oregon"), State(name="Idaho")]
+        for state in states:
+            models.storage.new(state)
+        found = models.storage.get_many(State, [states[1].id, "missing",
+                                                states[0].id],
+                                        load=["cities"])
+        self.assertEqual(found, [states[1], states[0]])
+
+
+class TestFileStorageCounts(unittest.TestCase):
+    '''Tests the counts method on the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_counts(self):
+        '''Tests that counts matches count for each class'''
+        models.storage.new(State(name="Oregon"))
+        counts = models.storage.counts()
+        self.assertEqual(sorted(counts), sorted(classes))
+        for name, cls in classes.items():
+            self.assertEqual(counts[name], models.storage.count(cls))
+        self.assertEqual(models.storage.counts([State, "City"]),
+                         {"State": models.storage.count(State),
+                          "City": models.storage.count(City)})
+
+
+class TestFileStorageIterate(unittest.TestCase):
+    '''Tests the iterate method on the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_iterate(self):
+        '''Tests that iterate yields the objects of all'''
+        models.storage.new(State(name="Oregon"))
+        self.assertEqual(
+            sorted(obj.id for obj in models.storage.iterate(chunk_size=2)),
+            sorted(obj.id for obj in models.storage.all().values()))
+        self.assertEqual(
+            sorted(obj.id for obj in models.storage.iterate(State, 1)),
+            sorted(obj.id for obj in models.storage.all(State).values()))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_iterate_skips_deleted(self):
+        '''Tests that objects deleted during an iteration are skipped'''
+        states = [State(name=str(i)) for i in range(4)]
+        for state in states:
+            models.storage.new(state)
+        deleted = set()
+        for obj in models.storage.iterate(State, chunk_size=1):
+            self.assertNotIn(obj.id, deleted)
+            for state in states:
+                if state is not obj and state.id not in deleted:
+                    models.storage.delete(state)
+                    deleted.add(state.id)
+        self.assertGreaterEqual(len(deleted), 3)
+
+
+class TestFileStoragePage(FileStorageTestCase):
+    '''Tests the page method on the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_pages(self):
+        '''Tests that paging through a class yields each object once, in
+        order, as objects come and go'''
+        state = State(name="Oregon")
+        models.storage.new(state)
+        for i in range(5):
+            models.storage.new(City(name=str(i), state_id=state.id))
+        models.storage.new(City(name="Boise", state_id="other"))
+        ids, after = [], None
+        while True:
+            page = models.storage.page(City, 2, after, "state_id", state.id)
+            if not page:
+                break
+            ids.extend(city.id for city in page)
+            after = page[-1].id
+            if len(ids) == 2:
+                city = City(name="late", state_id=state.id)
+                models.storage.new(city)
+                models.storage.delete(page[0])
+        self.assertEqual(ids, sorted(set(ids)))
+        # the late city is missed if its id sorts before the cursor
+        self.assertLessEqual({c.id for c in state.cities} - set(ids),
+                             {city.id})
+        self.assertEqual(models.storage.count(City, "state_id", state.id),
+                         5)
+        self.assertEqual(models.storage.count(City, "name", "Boise"), 1)
+        everything = models.storage.page(State, models.storage.count(State))
+        self.assertEqual([obj.id for obj in everything],
+                         sorted(obj.id for obj in
+                                models.storage.all(State).values()))
+        self.assertEqual(models.storage.page(City, 5, attr="name",
+                                             value="Boise")[0].state_id,
+                         "other")
+
 
 class TestFileStorageGetMethod(unittest.TestCase):
     '''Tests the get method of FileStorage class
@@ -158,3 +281,728 @@ class TestFileStorageGetMethod(unittest.TestCase):
         new_place = Place()
         new_place.save()
         self.assertEqual(models.storage.get(Place, new_place.id), new_place)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_get_object_with_wrong_cls(self):
+        '''Tests that get does not return an object of another class
+            with the same id
+        '''
+        new_place = Place()
+        new_place.save()
+        self.assertIsNone(models.storage.get(City, new_place.id))
+        self.assertIsNone(models.storage.get(Place, "missing"))
+        self.assertEqual(models.storage.get("Place", new_place.id), new_place)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_get_after_objects_replaced(self):
+        '''Tests that get and count follow a replaced __objects dict
+        '''
+        storage = FileStorage()
+        new_state = State()
+        save = FileStorage._FileStorage__objects
+        FileStorage._FileStorage__objects = {"State." + new_state.id:
+                                             new_state}
+        try:
+            self.assertIs(storage.get(State, new_state.id), new_state)
+            self.assertEqual(storage.count(State), 1)
+            self.assertEqual(storage.count(), 1)
+        finally:
+            FileStorage._FileStorage__objects = save
+        self.assertIsNone(storage.get(State, new_state.id))
+
+
+class TestFileStorageRelated(unittest.TestCase):
+    '''Tests the foreign key indexes of the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_state_cities(self):
+        '''Tests that State.cities lists the cities of the state
+        '''
+        state = State(name="Oregon")
+        state.save()
+        city = City(name="Portland", state_id=state.id)
+        city.save()
+        self.assertEqual(state.cities, [city])
+        self.assertEqual(models.storage.related(City, "state_id", state.id),
+                         [city])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_reassigned_foreign_key(self):
+        '''Tests that the indexes follow a reassigned foreign key
+        '''
+        place_a = Place(name="A")
+        place_b = Place(name="B")
+        place_a.save()
+        place_b.save()
+        review = Review(text="nice", place_id=place_a.id)
+        review.save()
+        self.assertEqual(place_a.reviews, [review])
+        review.place_id = place_b.id
+        self.assertEqual(place_a.reviews, [])
+        self.assertEqual(place_b.reviews, [review])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_deleted_object_unindexed(self):
+        '''Tests that a deleted object is removed from the indexes
+        '''
+        city = City(name="Bend")
+        city.save()
+        place = Place(city_id=city.id)
+        place.save()
+        user = User()
+        user.save()
+        place.user_id = user.id
+        self.assertEqual(city.places, [place])
+        self.assertEqual(user.places, [place])
+        models.storage.delete(place)
+        self.assertEqual(city.places, [])
+        self.assertEqual(user.places, [])
+
+
+class TestFileStorageJournal(FileStorageTestCase):
+    '''Tests the journaled persistence mode of the FileStorage class
+    '''
+    def setUp(self):
+        '''Points the storage to an empty file in journal mode'''
+        super().setUp()
+        FileStorage._FileStorage__journal = True
+
+    def reloaded(self):
+        '''Returns the objects read back from disk'''
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        return self.storage.all()
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_save_appends_changes(self):
+        '''Tests that saves after the first one only append the changed
+            objects to the journal
+        '''
+        state = State(name="Utah")
+        self.storage.new(state)
+        self.storage.save()
+        city = City(name="Provo", state_id=state.id)
+        self.storage.new(city)
+        self.storage.save()
+        with open(self.path + ".log") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0]),
+                         {"City." + city.id: city.to_dict(False)})
+        objs = self.reloaded()
+        self.assertEqual(sorted(objs), sorted(["State." + state.id,
+                                               "City." + city.id]))
+        self.assertEqual(objs["City." + city.id].name, "Provo")
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_deletion_replayed(self):
+        '''Tests that a journaled deletion is replayed by reload'''
+        state = State(name="Idaho")
+        self.storage.new(state)
+        self.storage.save()
+        self.storage.delete(state)
+        self.storage.save()
+        self.assertNotIn("State." + state.id, self.reloaded())
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_truncated_line_ignored(self):
+        '''Tests that a partially written journal line is skipped'''
+        state = State(name="Nevada")
+        self.storage.new(state)
+        self.storage.save()
+        state.name = "Nevada!"
+        self.storage.new(state)
+        self.storage.save()
+        with open(self.path + ".log", "a") as f:
+            f.write('{"State.x": {"name"')
+        objs = self.reloaded()
+        self.assertEqual(objs["State." + state.id].name, "Nevada!")
+        self.assertEqual(len(objs), 1)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_compact(self):
+        '''Tests that compaction folds the journal into the JSON file'''
+        states = [State(name=str(i)) for i in range(3)]
+        for state in states:
+            self.storage.new(state)
+            self.storage.save()
+        self.storage.delete(states[0])
+        self.storage.save()
+        self.storage.compact(wait=True)
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        with open(self.path) as f:
+            self.assertEqual(sorted(json.load(f)),
+                             sorted(["State." + s.id for s in states[1:]]))
+        self.assertEqual(len(self.reloaded()), 2)
+
+    @unittest.skipIf(os.name != "posix", "no process ids to check")
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_compact_removes_stale_files(self):
+        '''Tests that compaction removes the temporary files left by
+            the compactions of processes that exited
+        '''
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        stale = "{}.compact.{:d}".format(self.path, exited.pid)
+        alive = "{}.compact.{:d}".format(self.path, os.getppid())
+        for path in [stale, alive]:
+            with open(path, "w") as f:
+                f.write("{")
+        self.storage.new(State(name="Ohio"))
+        self.storage.save()
+        self.storage.compact(wait=True)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(alive))
+        self.assertEqual(len(self.reloaded()), 1)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_compact_on_threshold(self):
+        '''Tests that a save crossing the journal size threshold starts
+            a compaction
+        '''
+        saved = FileStorage._FileStorage__compact_bytes
+        FileStorage._FileStorage__compact_bytes = 0
+        try:
+            state = State(name="Ohio")
+            self.storage.new(state)
+            self.storage.save()
+            self.storage.new(state)
+            self.storage.save()
+            self.storage.compact(wait=True)
+        finally:
+            FileStorage._FileStorage__compact_bytes = saved
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        self.assertIn("State." + state.id, self.reloaded())
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_close_skips_unchanged_file(self):
+        '''Tests that close does not reload files that did not change'''
+        state = State(name="Texas")
+        self.storage.new(state)
+        self.storage.save()
+        self.storage.new(state)
+        self.storage.save()
+        self.storage.close()
+        self.assertIs(self.storage.get(State, state.id), state)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_close_replays_new_journal_lines(self):
+        '''Tests that close only applies the journal lines appended by
+            another writer
+        '''
+        state = State(name="Maine")
+        self.storage.new(state)
+        self.storage.save()
+        other = State(name="Vermont")
+        with open(self.path + ".log", "a") as f:
+            f.write(json.dumps({"State." + other.id:
+                                other.to_dict(False)}) + "\n")
+        self.storage.close()
+        self.assertIs(self.storage.get(State, state.id), state)
+        self.assertEqual(self.storage.get(State, other.id).name, "Vermont")
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_close_reloads_rewritten_file(self):
+        '''Tests that close reloads a JSON file rewritten by another
+            writer
+        '''
+        state = State(name="Iowa")
+        self.storage.new(state)
+        self.storage.save()
+        record = state.to_dict(False)
+        record["name"] = "Kansas"
+        with open(self.path, "w") as f:
+            json.dump({"State." + state.id: record}, f)
+        os.utime(self.path, ns=(0, 0))
+        self.storage.close()
+        self.assertEqual(self.storage.get(State, state.id).name, "Kansas")
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_unchanged_save_skipped(self):
+        '''Tests that saving an object without changes writes nothing and
+            keeps updated_at
+        '''
+        state = State(name="Alabama")
+        state.save()
+        updated_at = state.updated_at
+        state.name = "Alabama"
+        self.assertFalse(self.storage.is_dirty(state))
+        state.save()
+        self.assertEqual(state.updated_at, updated_at)
+        self.assertFalse(os.path.exists(self.path + ".log"))
+        state.name = "Alaska"
+        self.assertTrue(self.storage.is_dirty(state))
+        state.save()
+        self.assertNotEqual(state.updated_at, updated_at)
+        with open(self.path + ".log") as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_save_writes_changed_attributes(self):
+        '''Tests that storage.save persists attributes set since the
+            last save
+        '''
+        state = State(name="Florida")
+        state.save()
+        other = State(name="Hawaii")
+        other.name = "Maui"
+        state.name = "Georgia"
+        self.storage.save()
+        with open(self.path + ".log") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines, [{"State." + state.id:
+                                  state.to_dict(False)}])
+
+
+class TestFileStorageLazy(FileStorageTestCase):
+    '''Tests that the FileStorage class builds objects on first access
+    '''
+    def setUp(self):
+        '''Saves a few objects to an empty file and reloads them'''
+        super().setUp()
+        self.state = State(name="Arizona")
+        self.city = City(name="Tucson", state_id=self.state.id)
+        self.amenity = Amenity(name="Pool")
+        for obj in [self.state, self.city, self.amenity]:
+            self.storage.new(obj)
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_reload_builds_nothing(self):
+        '''Tests that counts and indexes work before objects are built'''
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+        self.assertEqual(self.storage.count(), 3)
+        self.assertEqual(self.storage.count(City), 1)
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_get_builds_one_object(self):
+        '''Tests that get only builds the object asked for'''
+        state = self.storage.get(State, self.state.id)
+        self.assertEqual(state.to_dict(), self.state.to_dict())
+        self.assertIs(self.storage.get(State, self.state.id), state)
+        self.assertEqual(list(FileStorage._FileStorage__objects),
+                         ["State." + self.state.id])
+        self.assertEqual([c.id for c in state.cities], [self.city.id])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_all_builds_objects(self):
+        '''Tests that all returns built objects'''
+        self.assertEqual(list(self.storage.all(Amenity).values())[0].name,
+                         "Pool")
+        self.assertEqual(len(self.storage.all()), 3)
+        for obj in self.storage.all().values():
+            self.assertIsInstance(obj, BaseModel)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_save_keeps_unbuilt_objects(self):
+        '''Tests that a full save writes the objects never built'''
+        self.storage.get(State, self.state.id).name = "Arkansas"
+        self.storage.save()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(self.storage.count(), 3)
+        self.assertEqual(self.storage.get(State, self.state.id).name,
+                         "Arkansas")
+
+
+class TestFileStorageDurability(FileStorageTestCase):
+    '''Tests the durability modes of the FileStorage class
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_interval_defers_write(self):
+        '''Tests that a save in interval mode is written by flush'''
+        FileStorage._FileStorage__durability = "interval"
+        saved = FileStorage._FileStorage__flush_ms
+        FileStorage._FileStorage__flush_ms = 60000
+        try:
+            state = State(name="Georgia")
+            self.storage.new(state)
+            self.storage.save()
+            self.assertFalse(os.path.exists(self.path))
+            self.storage.flush()
+        finally:
+            FileStorage._FileStorage__flush_ms = saved
+        with open(self.path) as f:
+            self.assertIn("State." + state.id, json.load(f))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_group_coalesces_saves(self):
+        '''Tests that saves waiting on a write in group mode share the
+            next one
+        '''
+        FileStorage._FileStorage__durability = "group"
+        before = self.storage.flush_stats()
+        lock = FileStorage._FileStorage__lock
+        threads = [threading.Thread(target=self.storage.save)
+                   for i in range(5)]
+        with lock:
+            for thread in threads:
+                thread.start()
+            while self.storage.flush_stats()["saves"] < before["saves"] + 5:
+                time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        after = self.storage.flush_stats()
+        self.assertEqual(after["mode"], "group")
+        self.assertLessEqual(after["flushes"] - before["flushes"], 2)
+        self.assertGreaterEqual(after["coalesced"] - before["coalesced"], 3)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_group_failed_write(self):
+        '''Tests that every save of a failed write in group mode raises
+            its error, and that no save counts as written
+        '''
+        FileStorage._FileStorage__durability = "group"
+        before = self.storage.flush_stats()
+
+        def fail():
+            while self.storage.flush_stats()["saves"] < before["saves"] + 4:
+                time.sleep(0.01)
+            raise OSError("disk full")
+        errors = []
+
+        def save():
+            try:
+                self.storage.save()
+            except OSError as error:
+                errors.append(error)
+        threads = [threading.Thread(target=save) for i in range(4)]
+        with mock.patch.object(FileStorage, "_FileStorage__flush",
+                               side_effect=fail):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(errors), 4)
+        after = self.storage.flush_stats()
+        self.assertEqual(after["flushes"], before["flushes"])
+        self.assertEqual(after["coalesced"], before["coalesced"])
+        self.assertLess(FileStorage._FileStorage__flushed, after["saves"])
+        self.storage.save()
+        self.assertEqual(FileStorage._FileStorage__flushed,
+                         self.storage.flush_stats()["saves"])
+
+
+class TestFileStorageSharded(FileStorageTestCase):
+    '''Tests the sharded on-disk layout of the FileStorage class
+    '''
+    def setUp(self):
+        '''Points the storage to an empty directory of shards'''
+        super().setUp()
+        self.dir = self.path + ".d"
+        FileStorage._FileStorage__layout = "sharded"
+        FileStorage._FileStorage__buckets = 1
+
+    def reloaded(self):
+        '''Returns the objects read back from disk'''
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        return self.storage.all()
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_one_file_per_class(self):
+        '''Tests that each class is saved to its own shard'''
+        state = State(name="Iowa")
+        city = City(name="Ames", state_id=state.id)
+        for obj in [state, city]:
+            self.storage.new(obj)
+        self.storage.save()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ["City.json", "MANIFEST", "State.json"])
+        with open(os.path.join(self.dir, "State.json")) as f:
+            self.assertEqual(list(json.load(f)), ["State." + state.id])
+        objects = self.reloaded()
+        self.assertEqual(objects["City." + city.id].name, "Ames")
+        self.assertEqual(objects["State." + state.id].name, "Iowa")
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_save_rewrites_dirty_shards(self):
+        '''Tests that a save only rewrites the shards that changed'''
+        state = State(name="Iowa")
+        amenity = Amenity(name="Sauna")
+        for obj in [state, amenity]:
+            self.storage.new(obj)
+        self.storage.save()
+        shard = os.path.join(self.dir, "Amenity.json")
+        before = os.stat(shard).st_ino
+        state.name = "Idaho"
+        self.storage.save()
+        self.assertEqual(os.stat(shard).st_ino, before)
+        self.assertEqual(self.reloaded()["State." + state.id].name, "Idaho")
+        self.storage.delete(self.storage.get(State, state.id))
+        self.storage.save()
+        self.assertEqual(list(self.reloaded()), ["Amenity." + amenity.id])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_buckets(self):
+        '''Tests that ids are spread over buckets, and moved when their
+            number changes
+        '''
+        FileStorage._FileStorage__buckets = 4
+        states = [State(name=str(i)) for i in range(20)]
+        for state in states:
+            self.storage.new(state)
+        self.storage.save()
+        shards = [name for name in os.listdir(self.dir)
+                  if name.startswith("State.")]
+        self.assertGreater(len(shards), 1)
+        FileStorage._FileStorage__buckets = 2
+        self.assertEqual(len(self.reloaded()), 20)
+        self.storage.save()
+        self.assertLessEqual(len(os.listdir(self.dir)), 3)
+        self.assertEqual(len(self.reloaded()), 20)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_unreadable_shard(self):
+        '''Tests that a damaged shard does not prevent reading the
+            others
+        '''
+        state = State(name="Iowa")
+        amenity = Amenity(name="Sauna")
+        for obj in [state, amenity]:
+            self.storage.new(obj)
+        self.storage.save()
+        with open(os.path.join(self.dir, "State.json"), "w") as f:
+            f.write("{\n\"State.")
+        self.assertEqual(list(self.reloaded()), ["Amenity." + amenity.id])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_reshard(self):
+        '''Tests converting a JSON file to shards'''
+        FileStorage._FileStorage__layout = "single"
+        state = State(name="Iowa")
+        self.storage.new(state)
+        self.storage.save()
+        self.storage.reshard()
+        self.assertEqual(FileStorage._FileStorage__layout, "sharded")
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "State.json")))
+        os.remove(self.path)
+        self.assertEqual(list(self.reloaded()), ["State." + state.id])
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_first_run_splits_file(self):
+        '''Tests that the JSON file is read when there are no shards yet,
+            and split on the next save
+        '''
+        FileStorage._FileStorage__layout = "single"
+        state = State(name="Iowa")
+        self.storage.new(state)
+        self.storage.save()
+        FileStorage._FileStorage__layout = "sharded"
+        self.assertEqual(list(self.reloaded()), ["State." + state.id])
+        self.storage.save()
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "State.json")))
+
+
+class TestFileStorageBinary(FileStorageTestCase):
+    '''Tests the binary snapshot format of the FileStorage class
+    '''
+    def setUp(self):
+        '''Points the storage to an empty file in binary format'''
+        super().setUp()
+        FileStorage._FileStorage__format = "binary"
+
+    def reloaded(self):
+        '''Returns the records read back from disk'''
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        return {key: obj.to_dict(False)
+                for key, obj in self.storage.all().items()}
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_get_decodes_one_record(self):
+        '''Tests that get only decodes the record asked for'''
+        state = State(name="Utah")
+        city = City(name="Provo", state_id=state.id)
+        for obj in [state, city]:
+            self.storage.new(obj)
+        self.storage.save()
+        with open(self.path, "rb") as f:
+            self.assertTrue(snapshot.is_snapshot(f))
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        lazy = FileStorage._FileStorage__lazy
+        self.assertEqual(self.storage.get(State, state.id).name, "Utah")
+        self.assertIsNone(lazy["City." + city.id].record)
+        self.assertEqual(self.storage.count(City), 1)
+        self.assertEqual(len(self.storage.related(City, "state_id",
+                                                  state.id)), 1)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_round_trip_with_json(self):
+        '''Tests that converting between JSON and binary keeps every
+            record
+        '''
+        FileStorage._FileStorage__format = "json"
+        for obj in [State(name="Utah"), Place(name="Loft", latitude=1.5),
+                    Amenity(name="Wifi")]:
+            self.storage.new(obj)
+        self.storage.save()
+        records = self.reloaded()
+        FileStorage._FileStorage__format = "binary"
+        self.storage.save()
+        self.assertEqual(self.reloaded(), records)
+        FileStorage._FileStorage__format = "json"
+        self.storage.save()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), records)
+
+
+class TestFileStorageThreads(FileStorageTestCase):
+    '''Tests that the FileStorage class can be used from several threads
+    '''
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_all_is_a_snapshot(self):
+        '''Tests that the dictionary returned by all does not change'''
+        state = State(name="Maine")
+        self.storage.new(state)
+        objects = self.storage.all()
+        self.storage.new(City(name="Bangor", state_id=state.id))
+        self.storage.delete(state)
+        self.assertEqual(list(objects), ["State." + state.id])
+        self.assertIsNot(self.storage.all(), objects)
+        self.assertEqual(self.storage.count(), 1)
+        self.assertEqual(self.storage.count(State), 0)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_writes_do_not_block_objects(self):
+        '''Tests that the objects can be used while a save is writing'''
+        writing = threading.Event()
+        resume = threading.Event()
+        dump = FileStorage._FileStorage__dump
+
+        def slow_dump(storage, records, path):
+            writing.set()
+            resume.wait(10)
+            dump(storage, records, path)
+        self.storage.new(State(name="Maine"))
+        with mock.patch.object(FileStorage, "_FileStorage__dump",
+                               slow_dump):
+            saver = threading.Thread(target=self.storage.save)
+            saver.start()
+            self.assertTrue(writing.wait(10))
+            state = State(name="Vermont")
+            self.storage.new(state)
+            self.assertIs(self.storage.get(State, state.id), state)
+            self.assertEqual(len(self.storage.all()), 2)
+            resume.set()
+            saver.join()
+        self.assertTrue(self.storage.is_dirty(state))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_concurrent_readers_and_writers(self):
+        '''Tests that iterating over the objects while other threads
+            change them raises no error
+        '''
+        errors = []
+
+        def write():
+            try:
+                for i in range(100):
+                    state = State(name=str(i))
+                    self.storage.new(state)
+                    if i % 3 == 0:
+                        self.storage.delete(state)
+                    if i % 10 == 0:
+                        self.storage.save()
+            except Exception as error:
+                errors.append(error)
+
+        def read():
+            try:
+                for i in range(100):
+                    for obj in self.storage.all().values():
+                        obj.to_dict()
+                    for obj in self.storage.all(State).values():
+                        obj.to_dict()
+            except Exception as error:
+                errors.append(error)
+        threads = [threading.Thread(target=f) for f in [write, read] * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.storage.save()
+        objects = self.storage.all()
+        FileStorage._FileStorage__objects = {}
+        self.storage.reload()
+        self.assertEqual(sorted(self.storage.all()), sorted(objects))
+
+
+class TestFileStorageProcesses(FileStorageTestCase):
+    '''Tests that processes sharing the files of the FileStorage class do
+        not lose each other's saves
+    '''
+    def other_process(self, code, **env):
+        '''Runs code in another process using the same file, with the
+            environment variables env, and returns what it prints
+        '''
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ, PYTHONPATH=root, **env)
+        return subprocess.run(
+            [sys.executable, "-c", "from models import storage\n" +
+             "from models.state import State\n" + code],
+            cwd=self.tmp, env=env, check=True, capture_output=True,
+            text=True).stdout.strip()
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_ascii_locale(self):
+        '''Tests that non-ASCII names are saved and read back whatever
+            the locale encoding'''
+        for journal in ["0", "1"]:
+            with self.subTest(journal=journal):
+                self.assertEqual(self.other_process(
+                    "State(name='S\\u00e3o Paulo').save()\n"
+                    "storage.reload()\n"
+                    "print(ascii(sorted(state.name for state in "
+                    "storage.all(State).values())))",
+                    LC_ALL="C", LANG="C", PYTHONCOERCECLOCALE="0",
+                    PYTHONUTF8="0", HBNB_FILE_JOURNAL=journal),
+                    ascii(["S\u00e3o Paulo"] * (int(journal) + 1)))
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_save_merges_other_process(self):
+        '''Tests that a save keeps the objects another process saved'''
+        mine = State(name="Ohio")
+        self.storage.new(mine)
+        self.storage.save()
+        other = self.other_process("state = State(name='Utah')\n"
+                                   "state.save()\n"
+                                   "print(state.id)")
+        late = State(name="Iowa")
+        self.storage.new(late)
+        self.storage.save()
+        with open(self.path) as f:
+            self.assertEqual(sorted(json.load(f)),
+                             sorted("State." + id
+                                    for id in [mine.id, other, late.id]))
+        with open(self.path + ".lock") as f:
+            self.assertEqual(int(f.read()), 3)
+
+    @unittest.skipIf(models.storage_t == 'db', "not testing file storage")
+    def test_close_applies_other_process(self):
+        '''Tests that close applies the changes saved by another process,
+            and keeps the changes not saved yet
+        '''
+        gone = State(name="Ohio")
+        kept = State(name="Utah")
+        for obj in [gone, kept]:
+            self.storage.new(obj)
+        self.storage.save()
+        self.storage.close()
+        self.assertIs(self.storage.get(State, kept.id), kept)
+        self.other_process("storage.delete(storage.get(State, '{}'))\n"
+                           "storage.get(State, '{}').name = 'Iowa'\n"
+                           "storage.save()".format(gone.id, kept.id))
+        unsaved = State(name="Maine")
+        self.storage.new(unsaved)
+        self.storage.close()
+        self.assertIsNone(self.storage.get(State, gone.id))
+        self.assertEqual(self.storage.get(State, kept.id).name, "Iowa")
+        self.assertIs(self.storage.get(State, unsaved.id), unsaved)
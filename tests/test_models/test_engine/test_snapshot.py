@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+"""
+Contains the TestSnapshotDocs and TestSnapshot classes
+"""
+
+import inspect
+import io
+import json
+from models.engine import snapshot
+import os
+import pep8
+import shutil
+import tempfile
+import unittest
+
+records = {"State.1": {"id": "1", "name": "Ohio", "__class__": "State"},
+           "City.2": {"id": "2", "state_id": "1", "name": "Akron",
+                      "__class__": "City"},
+           "Place.3": {"id": "3", "amenity_ids": ["a", "b"],
+                       "latitude": 37.5, "name": "Big \"loft\", {nice} é",
+                       "__class__": "Place"}}
+
+
+class TestSnapshotDocs(unittest.TestCase):
+    """Tests to check the documentation and style of the snapshot module"""
+    def test_pep8_conformance_snapshot(self):
+        """Test that models/engine/snapshot.py conforms to PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['models/engine/snapshot.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_pep8_conformance_test_snapshot(self):
+        """Test tests/test_models/test_engine/test_snapshot.py conforms to
+        PEP8."""
+        pep8s = pep8.StyleGuide(quiet=True)
+        result = pep8s.check_files(['tests/test_models/test_engine/\
+test_snapshot.py'])
+        self.assertEqual(result.total_errors, 0,
+                         "Found code style errors (and warnings).")
+
+    def test_snapshot_module_docstring(self):
+        """Test for the snapshot.py module docstring"""
+        self.assertIsNot(snapshot.__doc__, None,
+                         "snapshot.py needs a docstring")
+        self.assertTrue(len(snapshot.__doc__) >= 1,
+                        "snapshot.py needs a docstring")
+
+    def test_snapshot_func_docstrings(self):
+        """Test for the presence of docstrings in snapshot functions"""
+        for func in inspect.getmembers(snapshot, inspect.isfunction):
+            self.assertIsNot(func[1].__doc__, None,
+                             "{:s} function needs a docstring".format(func[0]))
+            self.assertTrue(len(func[1].__doc__) >= 1,
+                            "{:s} function needs a docstring".format(func[0]))
+
+
+class TestSnapshot(unittest.TestCase):
+    """Test the binary snapshot reader and writer"""
+    def setUp(self):
+        """Creates a temporary directory"""
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "file.bin")
+
+    def tearDown(self):
+        """Removes the temporary directory"""
+        shutil.rmtree(self.tmp)
+
+    def read(self):
+        """Returns the (key, record) pairs read back from the file"""
+        with open(self.path, "rb") as f:
+            return list(snapshot.iter_records(f))
+
+    def write(self, records):
+        """Writes records to a new file, replacing the file mapped by the
+        records already read"""
+        with open(self.path + ".tmp", "wb") as f:
+            snapshot.dump_records(records, f, {"City": ("state_id",)})
+        os.replace(self.path + ".tmp", self.path)
+
+    def test_round_trip(self):
+        """Test that records are read back unchanged"""
+        self.write(records)
+        pairs = self.read()
+        self.assertEqual([key for key, record in pairs], list(records))
+        self.assertEqual({key: dict(record) for key, record in pairs},
+                         records)
+        with open(self.path, "rb") as f:
+            self.assertTrue(snapshot.is_snapshot(f))
+
+    def test_lazy_decoding(self):
+        """Test that records are decoded on access, and indexed fields
+        are read without decoding"""
+        self.write(records)
+        pairs = dict(self.read())
+        city = pairs["City.2"]
+        self.assertEqual(city.get("state_id"), "1")
+        self.assertIsNone(city.record)
+        self.assertEqual(city["name"], "Akron")
+        self.assertIsNotNone(city.record)
+        self.assertIsNone(pairs["State.1"].record)
+
+    def test_copy_undecoded_records(self):
+        """Test that records read from a snapshot are copied to another
+        without being decoded"""
+        self.write(records)
+        pairs = dict(self.read())
+        self.write(pairs)
+        self.assertIsNone(pairs["State.1"].record)
+        self.assertEqual({key: dict(record) for key, record in self.read()},
+                         records)
+
+    def test_not_a_snapshot(self):
+        """Test that JSON and truncated files are rejected"""
+        with open(self.path, "w") as f:
+            json.dump(records, f)
+        with open(self.path, "rb") as f:
+            self.assertFalse(snapshot.is_snapshot(f))
+        self.write(records)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+        with self.assertRaises(ValueError):
+            self.read()